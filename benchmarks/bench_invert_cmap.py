@@ -0,0 +1,44 @@
+"""Time invert_cmap on a large synthetic image with a varying number of
+worker threads.
+
+Usage: python benchmarks/bench_invert_cmap.py [size] [max_workers]
+"""
+from __future__ import division, print_function
+from multiprocessing import cpu_count
+import sys
+import time
+
+import numpy as np
+
+from yoink.interp import invert_cmap
+
+
+def best_time(f, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        f()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def main(size=2000, max_workers=None):
+    max_workers = max_workers or cpu_count()
+    l = np.linspace(0, 1, 256)
+    colors = np.random.random((256, 3))
+    pix = np.random.random((size, size, 3))
+    invert_cmap(pix[:1], l, colors)  # build & cache the tree
+
+    print('%d x %d image, %d CPUs' % (size, size, cpu_count()))
+    print('workers    time (s)    speedup')
+    t1 = None
+    workers = 1
+    while workers <= max_workers:
+        t = best_time(lambda: invert_cmap(pix, l, colors, workers=workers))
+        t1 = t1 or t
+        print('%7d    %8.3f    %7.2f' % (workers, t, t1 / t))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""Compare span-at-a-time and batched Ramer-Douglas-Peucker simplification on
+one long noisy trace and on many short ones.
+
+Usage: python benchmarks/bench_simplify.py
+"""
+from __future__ import division, print_function
+import time
+
+import numpy as np
+
+from yoink.simplify import rdp_indexes, rdp_indexes_batch, point_line_dist2
+
+
+def best_time(f, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        f()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def compare(name, points, offsets, eps2):
+    def loop():
+        for k in range(len(offsets) - 1):
+            # passing dist2 selects the one-span-at-a-time loop
+            rdp_indexes(points[offsets[k]:offsets[k+1]], eps2,
+                        dist2=point_line_dist2)
+
+    def batch():
+        rdp_indexes_batch(points, offsets, eps2)
+
+    t_loop = best_time(loop)
+    t_batch = best_time(batch)
+    print('%-28s %9.4f %9.4f %8.1fx' % (name, t_loop, t_batch,
+                                       t_loop / t_batch))
+
+
+def main():
+    rng = np.random.RandomState(0)
+    t = np.linspace(0, 60, 100000)
+    points = np.vstack((50 * t, 300 * np.sin(t))).T
+    points += rng.normal(0, 0.5, points.shape)
+    print('%-28s %9s %9s %9s' % ('', 'loop (s)', 'batch (s)', 'speedup'))
+    compare('1 line, 1e5 px, eps=2', points, [0, len(points)], 4.)
+    compare('1 line, 1e5 px, eps=0.1', points, [0, len(points)], 0.01)
+    offsets = np.arange(0, len(points) + 1, 50)
+    compare('2000 lines, 50 px, eps=2', points, offsets, 4.)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Compare the pure-Python and vectorized Bresenham tracers on one long line
+and on many short lines.
+
+Usage: python benchmarks/bench_trace.py
+"""
+from __future__ import division, print_function
+import time
+
+import numpy as np
+
+from yoink.trace import bresenham_trace, bresenham_trace_batch
+
+
+def best_time(f, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        f()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def compare(name, x0, y0, x1, y1):
+    def loop():
+        for line in zip(x0, y0, x1, y1):
+            bresenham_trace(*line)
+
+    def batch():
+        bresenham_trace_batch(x0, y0, x1, y1)
+
+    t_loop = best_time(loop)
+    t_batch = best_time(batch)
+    print('%-24s %9.4f %9.4f %8.1fx' % (name, t_loop, t_batch,
+                                       t_loop / t_batch))
+
+
+def main():
+    rng = np.random.RandomState(0)
+    print('%-24s %9s %9s %9s' % ('', 'loop (s)', 'batch (s)', 'speedup'))
+    compare('1 line, 100000 px', [0], [0], [100000], [31337])
+    x0, y0 = rng.randint(0, 2000, size=(2, 10000))
+    x1, y1 = rng.randint(0, 2000, size=(2, 10000))
+    compare('10000 lines, ~700 px', x0, y0, x1, y1)
+    x1, y1 = x0 + rng.randint(-20, 20, 10000), y0 + rng.randint(-20, 20, 10000)
+    compare('10000 lines, ~15 px', x0, y0, x1, y1)
+
+
+if __name__ == '__main__':
+    main()
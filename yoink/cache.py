@@ -0,0 +1,107 @@
+"""Small memoization helpers for expensive, reusable intermediate results."""
+from __future__ import division, print_function
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+
+def content_key(*arrays):
+    """
+    Hash the contents of a sequence of arrays into a hashable key.
+
+    Arrays with the same shape, dtype, and values produce the same key,
+    regardless of object identity.
+
+    Parameters
+    ----------
+    *arrays : array_like
+        arrays to include in the key
+
+    Returns
+    -------
+    key : str
+        hex digest of the array contents
+    """
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str(a.dtype).encode())
+        h.update(str(a.shape).encode())
+        h.update(a.reshape(-1).view(np.uint8))
+    return h.hexdigest()
+
+
+class LRUCache(object):
+    """
+    Mapping that holds at most `maxsize` items, evicting the least recently
+    used item when full.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        maximum number of items to hold.  0 disables caching.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of items to hold.  Shrinking it evicts items.
+    hits : int
+        number of lookups that found a cached item
+    misses : int
+        number of lookups that had to build a new item
+    """
+    def __init__(self, maxsize=8):
+        self._items = OrderedDict()
+        self._maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        self._maxsize = maxsize
+        self._evict()
+
+    def get(self, key, factory):
+        """
+        Return the item stored under `key`, calling `factory()` to create
+        (and store) it if it is missing.
+        """
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = factory()
+        else:
+            self.hits += 1
+        if self._maxsize > 0:
+            self._items[key] = value
+            self._evict()
+        return value
+
+    def set(self, key, value):
+        """Store `value` under `key`, replacing any item already there"""
+        self._items.pop(key, None)
+        if self._maxsize > 0:
+            self._items[key] = value
+            self._evict()
+
+    def clear(self):
+        """Remove all items and reset the hit/miss counters"""
+        self._items.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while len(self._items) > max(self._maxsize, 0):
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
@@ -22,6 +22,9 @@ class CmapExtractor(object):
         The pixels for the image to extract data from
     path : str
         The filename to save data.
+    invert_kw : dict, optional
+        keyword args to pass to invert_cmap when digitizing, e.g.
+        ``{'workers': -1}``
 
     Attributes
     ----------
@@ -51,7 +54,7 @@ class CmapExtractor(object):
     select_radio : matplotlib.widgets.Radio
         radio widget use to toggle active widgets
     """
-    def __init__(self, pixels, path):
+    def __init__(self, pixels, path, invert_kw=None):
         self.path = path
         # generate layout of figures and axes
         # there should be two figures: one for (sub)selecting data
@@ -89,7 +92,10 @@ class CmapExtractor(object):
         #
         # We are converting a multi-color image to a scalar image.
         # Plot that scalar image
-        self.rcol_widget = RecoloredWidget(ann_axes['img'], pixels)
+        # digitize in the background so the GUI stays responsive
+        self.rcol_widget = RecoloredWidget(ann_axes['img'], pixels,
+                                           invert_kw=invert_kw,
+                                           background=True)
         self.rcol_image = self.rcol_widget.image
         # fill axes with textboxes for typing in the x & y limits
         # these set the scale of x and y
@@ -111,6 +117,11 @@ class CmapExtractor(object):
 
         # Re-draw the colormap when the colorbar-selector moves
         # re-digitizing is expensive, so only do it when you release the mouse
+        # and show a coarse preview while dragging
+        self.cbar_select.on_changed(
+            lambda has_cb: self.rcol_widget.preview(has_cb.l, has_cb.rgb),
+            args=(self.cbar_select,),
+        )
         self.cbar_select.on_release(
             lambda has_cb: self.rcol_widget.digitize(has_cb.l, has_cb.rgb),
             args=(self.cbar_select,),
@@ -186,14 +197,21 @@ class CmapExtractor(object):
             y : 1D array
                 nj+1 coordinates of x grid
             z : 2D array
-                (ni,nj) values of centered in grid given by x and y
+                (ni,nj) values of centered in grid given by x and y.  NaN
+                where the color is off the colorbar.
+            mask : 2D array
+                (ni,nj) True where the color is off the colorbar (see
+                the max_dist option of invert_cmap)
             l : array
                 distance along colormap, on [0, 1] interval
             rgb: array
                 color of each point on colormap
         """
+        # the image is recolored in the background
+        self.rcol_widget.wait()
         data = {}
-        z = np.array(self.rcol_image._A)
+        z = np.ma.array(self.rcol_image._A, dtype=float)
+        data['mask'] = np.ma.getmaskarray(z)
 
         ni, nj = z.shape
         x0, x1, y0, y1 = self.rcol_image.get_extent()
@@ -210,7 +228,7 @@ class CmapExtractor(object):
         zmax = self.cbar_widget.fmt.mx
         dz = zmax - zmin
         z = zmin + dz * z
-        data['z'] = z
+        data['z'] = z.filled(np.nan)
 
         data['l'] = self.cbar_select.l
         data['rgb'] = self.cbar_select.rgb
@@ -117,7 +117,9 @@ def deltaE_ciede94(lab1, lab2, kH=1, kC=1, kL=1, k1=0.045, k2=0.015):
     c1 = np.sqrt(a1 ** 2 + b1 ** 2)
     c2 = np.sqrt(a2 ** 2 + b2 ** 2)
     dc = c1 - c2
-    dh_ab = np.sqrt(deltaE_cie76(lab1, lab2) ** 2 - dl ** 2 - dc ** 2)
+    # clip round-off, which can make dh_ab**2 slightly negative
+    dh_ab2 = deltaE_cie76(lab1, lab2) ** 2 - dl ** 2 - dc ** 2
+    dh_ab = np.sqrt(np.maximum(dh_ab2, 0))
 
     SL = 1
     SC = 1 + k1 * c1
@@ -195,8 +197,8 @@ def deltaE_ciede2000(lab1, lab2, kL=1, kC=1, kH=1):
 
     cc = c1_prime * c2_prime
     mask1 = cc == 0.
-    mask2 = np.logical_and(-mask1, dh_prime > np.pi)
-    mask3 = np.logical_and(-mask1, dh_prime < -np.pi)
+    mask2 = np.logical_and(~mask1, dh_prime > np.pi)
+    mask3 = np.logical_and(~mask1, dh_prime < -np.pi)
     dh_prime = np.where(mask1, 0., dh_prime)
     dh_prime += np.where(mask2, 2 * np.pi, 0)
     dh_prime -= np.where(mask3, 2 * np.pi, 0)
@@ -287,7 +289,9 @@ def deltaE_cmc(lab1, lab2, kL=1, kC=1):
     c2 = np.sqrt(a2 ** 2 + b2 ** 2)
     dC = c1 - c2
     dl = l1 - l2
-    dH = np.sqrt(deltaE_cie76(lab1, lab2) ** 2 - dl ** 2 - dC ** 2)
+    # clip round-off, which can make dH**2 slightly negative
+    dH2 = deltaE_cie76(lab1, lab2) ** 2 - dl ** 2 - dC ** 2
+    dH = np.sqrt(np.maximum(dH2, 0))
 
     dL = l1 - l2
 
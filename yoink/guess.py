@@ -1,15 +1,16 @@
 """Functions that try to infer the placement of key things (plot border, axes
 rotation, lines on a plot, etc) in a rasterized image."""
 from __future__ import division, print_function
+from math import ceil, sqrt
 
 import numpy as np
 from scipy import ndimage
-from skimage import img_as_uint
+from skimage import img_as_float, img_as_uint
 from skimage.measure import approximate_polygon
-from skimage.feature import corner_harris
+from skimage.feature import corner_harris, corner_peaks
 
 
-def guess_corners(bw):
+def guess_corners(bw, max_pixels=None):
     """
     Infer the corners of an image using a Sobel filter to find the edges and a
     Harris filter to find the corners.  Takes a single color chanel.
@@ -17,27 +18,199 @@ def guess_corners(bw):
     Parameters
     ----------
     bw : (m x n) ndarray of ints
+    max_pixels : int, optional
+        images with more pixels than this are searched on a downsampled copy
+        with at most `max_pixels` pixels, and each corner found there is
+        refined in a small window of the full resolution image.  Much faster
+        for large scans.  Corners are selected on the downsampled copy, so
+        the two searches return different sets: the full resolution search
+        also reports the pixel steps along rotated edges, and each search
+        finds some corners the other misses.  What the pyramid guarantees is
+        localization: every corner it returns lies within a pixel of the
+        boundary of the full resolution outline.
 
     Returns
     -------
     corners : pixel coordinates of plot corners, unsorted
-    outline : (m x n) ndarray of bools True -> plot area
+    outline : (m x n) ndarray of bools True -> plot area.  With `max_pixels`,
+        this is the outline found on the downsampled copy, scaled back up.
     """
     assert len(bw.shape) == 2
+    if max_pixels is not None and bw.size > max_pixels:
+        return _guess_corners_pyramid(bw, max_pixels)
+    outline = _plot_outline(bw)
+    corners = _outline_corners(outline)
+    return corners, outline
+
+
+def _segment(bw):
+    """Watershed segmentation of `bw` into background (1) & foreground (2)"""
     bw = img_as_uint(bw)
     e_map = ndimage.sobel(bw)
 
     markers = np.zeros(bw.shape, dtype=int)
     markers[bw < 30] = 1
     markers[bw > 150] = 2
-    seg = ndimage.watershed_ift(e_map, np.asarray(markers, dtype=int))
+    return ndimage.watershed_ift(e_map, np.asarray(markers, dtype=int))
+
+
+def _plot_outline(bw):
+    """True inside the outermost foreground shapes of `bw`"""
+    return ndimage.binary_fill_holes(1 - _segment(bw))
+
+
+def _outline_corners(outline, min_distance=10):
+    # corner_harris gives the corner response; corner_peaks picks out the
+    # corners themselves
+    response = corner_harris(np.asarray(outline, dtype=int))
+    corners = corner_peaks(response, min_distance=min_distance,
+                           threshold_rel=0.1)
+    if len(corners) == 0:
+        raise ValueError('no corners found in the plot outline; the frame '
+                         'should be bright on a dark background in bw')
+    return approximate_polygon(corners, 1)
+
+
+def _guess_corners_pyramid(bw, max_pixels):
+    """
+    guess_corners on a block-averaged copy of `bw`, with each corner then
+    refined in a window of the full resolution image around it.
+    """
+    ni, nj = bw.shape
+    f = int(ceil(sqrt(bw.size / max_pixels)))
+    small_outline = _plot_outline(downsample(bw, f))
+    small_corners = _outline_corners(small_outline,
+                                     min_distance=max(10 // f, 1))
+
+    # pixels well outside the coarse outline are outside at full resolution
+    outside = ~ndimage.binary_dilation(small_outline)
+    corners = [_refine_corner(bw, outside, corner, f)
+               for corner in small_corners]
+    corners = np.array(corners, dtype=int).reshape((-1, 2))
+
+    rows = np.minimum(np.arange(ni) // f, small_outline.shape[0] - 1)
+    cols = np.minimum(np.arange(nj) // f, small_outline.shape[1] - 1)
+    outline = small_outline[np.ix_(rows, cols)]
+    return corners, outline
+
+
+def _refine_corner(bw, outside, corner, f):
+    """
+    Find the full resolution corner near `corner` of the image downsampled
+    by `f`, by repeating the segmentation and corner response in a window.
+    `outside` marks the downsampled pixels known to be outside the plot, and
+    stands in for the hole filling, which needs the whole image.
+    """
+    ni, nj = bw.shape
+    ci, cj = (np.asarray(corner) + 0.5) * f - 0.5
+    r = 2 * f + 4
+    i0, i1 = max(int(ci) - r, 0), min(int(ci) + r + 1, ni)
+    j0, j1 = max(int(cj) - r, 0), min(int(cj) + r + 1, nj)
+    seg = _segment(bw[i0:i1, j0:j1])
+
+    # background connected to the known outside is outside; every other
+    # pixel is in the plot, like binary_fill_holes on the whole image
+    rows = np.minimum(np.arange(i0, i1) // f, outside.shape[0] - 1)
+    cols = np.minimum(np.arange(j0, j1) // f, outside.shape[1] - 1)
+    labels, n = ndimage.label(seg == 1)
+    seeds = labels[outside[np.ix_(rows, cols)] & (seg == 1)]
+    outline = ~np.isin(labels, seeds[seeds > 0])
+
+    response = corner_harris(np.asarray(outline, dtype=int))
+    ii, jj = np.ogrid[i0:i1, j0:j1]
+    far = (ii - ci)**2 + (jj - cj)**2 > (1.5 * f)**2
+    response[far] = -np.inf
+    i, j = np.unravel_index(np.argmax(response), response.shape)
+    return i + i0, j + j0
 
-    outline = ndimage.binary_fill_holes(1 - seg)
-    corners = corner_harris(np.asarray(outline, dtype=int))
-    corners = approximate_polygon(corners, 1)
+
+def downsample(bw, f):
+    """
+    Shrink a single channel image by an integer factor `f` by averaging
+    f x f blocks.  Edge pixels are repeated to fill partial blocks.  The
+    result has the dtype of `bw`.
+    """
+    ni, nj = bw.shape
+    pad = ((0, -ni % f), (0, -nj % f))
+    blocks = np.pad(np.asarray(bw, dtype=float), pad, mode='edge')
+    blocks = blocks.reshape((blocks.shape[0] // f, f, blocks.shape[1] // f, f))
+    small = blocks.mean(axis=(1, 3))
+    if issubclass(bw.dtype.type, np.integer):
+        np.rint(small, out=small)
+    return small.astype(bw.dtype)
+
+
+def guess_frame(bw, angles=None, frac=0.5, threshold=0.5):
+    """
+    Find a rectangular plot frame from the row and column profiles of the
+    frame pixels.  Much faster than guess_corners, and takes the same kind
+    of image: the frame (dark in the original figure) should be bright.
+
+    The frame lines are the outermost rows and columns whose count of frame
+    pixels is at least `frac` of the largest count.  For slightly rotated
+    figures, the profiles are taken along each of `angles` and the angle
+    with the sharpest profiles is used, a Hough transform restricted to
+    near horizontal and vertical lines.  Each angle costs one pass over the
+    frame pixels.
+
+    Parameters
+    ----------
+    bw : (m x n) ndarray
+        single channel image, frame pixels bright
+    angles : sequence of floats, optional
+        rotations of the frame, in degrees, to try.  Defaults to [0].
+    frac : float, optional
+        fraction of the longest line a row or column needs to be a frame
+        line
+    threshold : float, optional
+        brightness, on [0, 1], above which a pixel is a frame pixel
+
+    Returns
+    -------
+    corners : pixel coordinates of plot corners, (4 x 2) ndarray of ints
+    outline : (m x n) ndarray of bools True -> plot area
+    """
+    assert len(bw.shape) == 2
+    ii, jj = np.nonzero(img_as_float(bw) > threshold)
+    if not len(ii):
+        raise ValueError('no frame pixels above threshold')
+    if angles is None:
+        angles = [0.]
+
+    best = None
+    for angle in np.deg2rad(angles):
+        c, s = np.cos(angle), np.sin(angle)
+        u = ii * c + jj * s
+        v = jj * c - ii * s
+        u0, v0 = u.min(), v.min()
+        hu = np.bincount((u - u0).astype(int))
+        hv = np.bincount((v - v0).astype(int))
+        score = np.dot(hu, hu) + np.dot(hv, hv)
+        if best is None or score > best[0]:
+            best = score, c, s, u0 + _frame_lines(hu, frac), \
+                v0 + _frame_lines(hv, frac)
+    score, c, s, (top, bottom), (left, right) = best
+
+    u = np.array([top, top, bottom, bottom])
+    v = np.array([left, right, right, left])
+    corners = np.column_stack((u * c - v * s, u * s + v * c))
+    corners = np.rint(corners).astype(int)
+
+    # inside the rectangle, in the rotated coordinates
+    gi, gj = np.ogrid[:bw.shape[0], :bw.shape[1]]
+    gu = gi * c + gj * s
+    gv = gj * c - gi * s
+    outline = (gu >= top - 0.5) & (gu <= bottom + 0.5)
+    outline &= (gv >= left - 0.5) & (gv <= right + 0.5)
     return corners, outline
 
 
+def _frame_lines(profile, frac):
+    """first & last positions where `profile` reaches `frac` of its max"""
+    lines = np.flatnonzero(profile >= frac * profile.max())
+    return lines[0], lines[-1]
+
+
 def _get_angle(p1, p2):
     return np.arctan2(p1[0] - p2[0], p1[1] - p2[1])
 
@@ -2,24 +2,615 @@
 colormap, interpolating points from pixel to data coordinates, and such."""
 from __future__ import division, print_function
 
+from functools import partial
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
+from scipy.ndimage import map_coordinates
 from scipy.spatial import cKDTree
+from skimage.color import rgb2lab
+
+from .cache import LRUCache, content_key
+from .simplify import mask2paths
+from .delta_e import deltaE_cie76, deltaE_ciede94, deltaE_ciede2000, deltaE_cmc
 
+#: CmapIndexes built by invert_cmap, keyed by the contents of (l, colors).
+#: Resize with ``TREE_CACHE.maxsize = n``; ``TREE_CACHE.hits`` and
+#: ``TREE_CACHE.misses`` count how often a tree was reused or rebuilt.
+TREE_CACHE = LRUCache(maxsize=8)
 
-def invert_cmap(pix, l, colors):
+
+def invert_cmap(pix, l, colors, method='tree', metric='rgb', max_dist=None,
+                interpolate=False, max_memory=None, workers=1,
+                cache=TREE_CACHE):
     """
     Given a sequence of pixels, convert each to an equivalent index in the
     color sequence l, colors
 
     Uses a scipy.spatial.cKDTree to find the color with closest coordinates in
-    RGB space.
+    RGB space, or the perceptually closest color for the Lab based metrics.
+
+    Parameters
+    ----------
+    pix : array_like, shape=(ni, nj, nc)
+        pixels to invert
+    l : array_like, shape=(N,)
+        normalized location of colors
+    colors : array_like, shape=(N, nc)
+        sequence of colors at each point in l
+    method : {'tree', 'unique', 'lut'}, optional
+        'tree' queries the tree once per pixel.  'unique' queries the tree
+        once per distinct color, which is much faster for images with few
+        colors (e.g. rasterized pcolor plots).  'lut' answers 8-bit RGB(A)
+        pixels from a 2**24 entry lookup table that is filled in as new
+        colors are seen and kept with the cached tree.
+    metric : {'rgb', 'cie76', 'ciede94', 'ciede2000', 'cmc'}, optional
+        color distance to minimize.  'rgb' is Euclidean distance in RGB.
+        The others are the deltaE metrics from yoink.delta_e, computed in Lab
+        space.  'cie76' is Euclidean in Lab and uses a tree in Lab space.  The
+        rest re-rank the CmapIndex.candidates closest colors in Lab.
+    max_dist : float, optional
+        pixels farther than this from every color (in units of `metric`)
+        are not on the colormap; e.g. annotations, gridlines, and text.  They
+        are masked in the result.  For 'rgb' and 'cie76' the tree search
+        stops early for these pixels.
+    interpolate : bool, optional
+        treat `colors` as a polyline in color space and project each pixel
+        onto the nearest segment, interpolating `l` continuously instead of
+        snapping to the nearest sample.  A coarsely sampled colorbar then
+        gives sub-sample resolution.  Distances are Euclidean in RGB for
+        'rgb', and in Lab otherwise.  Not available for method='lut'.
+    max_memory : int, optional
+        approximate limit, in bytes, on the temporary arrays used while
+        inverting.  The image is processed in blocks of rows that fit in the
+        limit, so peak memory does not grow with the image size.  By default
+        the whole image is done in one block.
+    workers : int, optional
+        number of threads to split the image between.  -1 uses one thread
+        per CPU.  The tree query releases the GIL, so large images scale
+        with the number of cores.
+    cache : LRUCache or None, optional
+        cache of previously built trees.  Defaults to the module-wide
+        TREE_CACHE; pass None to always build a new tree.
+
+    Returns
+    -------
+    z : ndarray or MaskedArray, shape=(ni, nj)
+        value of l for the closest color to each pixel.  If `max_dist` is
+        given, this is a MaskedArray whose masked values are NaN.
     """
-    kd = cKDTree(colors)
+    l = np.asarray(l)
+    index = get_cmap_index(l, colors, metric=metric, cache=cache)
+    nearest = index.curve_query if interpolate else index.tree_query
+    if method == 'tree':
+        query = nearest
+    elif method == 'unique':
+        query = partial(index.unique_query, query=nearest)
+    elif method == 'lut':
+        if interpolate:
+            raise ValueError("method='lut' cannot interpolate")
+        query = index.lut_query
+    else:
+        raise ValueError('unknown method %r' % (method,))
+
+    if workers == -1:
+        workers = cpu_count()
+
+    pix = np.asarray(pix)
     ni, nj, nc = pix.shape
-    pix = pix.reshape((ni * nj, nc))
-    d, i = kd.query(pix)
-    i = i.reshape((ni, nj))
-    return l[i]
+    if interpolate:
+        # curve_query gives fractional indexes into l, NaN for "not found"
+        position = np.arange(len(l))
+        l = np.asarray(l, dtype=float)
+    elif max_dist is not None:
+        # index len(l) means "not found"
+        l = np.append(np.asarray(l, dtype=float), np.nan)
+    z = np.empty((ni, nj), dtype=l.dtype)
+    pixel_bytes = index.pixel_bytes(nc, interpolate=interpolate)
+    if workers > 1:
+        # a few blocks per thread so that uneven blocks even out
+        rows = -(-ni // (4 * workers))
+        if max_memory is not None:
+            rows = min(rows, block_rows(nj, nc, max_memory / workers,
+                                        pixel_bytes))
+    elif max_memory is not None:
+        rows = block_rows(nj, nc, max_memory, pixel_bytes)
+    else:
+        rows = ni
+    rows = max(rows, 1)
+
+    def invert_block(i0):
+        block = pix[i0:i0 + rows]
+        i = query(block.reshape((-1, nc)), max_dist=max_dist)
+        if interpolate:
+            # np.interp drops NaN when there is only one color
+            zi = np.where(np.isnan(i), np.nan, np.interp(i, position, l))
+        else:
+            zi = l[i]
+        z[i0:i0 + rows] = zi.reshape(block.shape[:2])
+
+    starts = range(0, ni, rows)
+    if workers > 1 and len(starts) > 1:
+        pool = ThreadPool(workers)
+        try:
+            pool.map(invert_block, starts)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for i0 in starts:
+            invert_block(i0)
+    if max_dist is not None:
+        z = np.ma.masked_invalid(z, copy=False)
+    return z
+
+
+def color_mask(pix, color, max_dist, **invert_kw):
+    """
+    Find the pixels within `max_dist` of a single color, e.g. the pixels
+    of one data series in a line plot.
+
+    Parameters
+    ----------
+    pix : array_like, shape=(ni, nj, nc)
+        pixels to test
+    color : array_like, shape=(nc,)
+        color to look for, on the same scale as `pix`
+    max_dist : float
+        largest distance from `color` (in units of `metric`) to accept
+    **invert_kw : optional
+        passed to invert_cmap, e.g. metric, method, max_memory, and workers
+
+    Returns
+    -------
+    mask : ndarray of bools, shape=(ni, nj)
+        True where the pixel is within `max_dist` of `color`
+    """
+    pix = np.asarray(pix)
+    # in the dtype of the pixels, so that e.g. uint8 colors scale the same
+    colors = np.asarray([color], dtype=pix.dtype)
+    z = invert_cmap(pix, [0.], colors, max_dist=max_dist, **invert_kw)
+    return ~np.ma.getmaskarray(z)
+
+
+def pixel_to_data(i, j, shape, extent=None, origin='upper'):
+    """
+    Convert pixel (row, column) coordinates to data coordinates, using the
+    same conventions as matplotlib's imshow.
+
+    Parameters
+    ----------
+    i, j : array_like
+        row and column coordinates.  Integers are pixel centers.
+    shape : tuple
+        (ni, nj) shape of the image
+    extent : sequence, optional
+        (left, right, bottom, top) of the image in data coordinates.  The
+        default puts pixel centers at integer coordinates, like imshow.
+    origin : {'upper', 'lower'}, optional
+        whether row 0 is at the top or the bottom of the image
+
+    Returns
+    -------
+    x, y : ndarray
+        data coordinates
+    """
+    ni, nj = shape[:2]
+    if extent is None:
+        if origin == 'upper':
+            extent = (-0.5, nj - 0.5, ni - 0.5, -0.5)
+        else:
+            extent = (-0.5, nj - 0.5, -0.5, ni - 0.5)
+    left, right, bottom, top = extent
+    if origin == 'upper':
+        bottom, top = top, bottom
+    x = left + (np.asarray(j) + 0.5) * ((right - left) / nj)
+    y = bottom + (np.asarray(i) + 0.5) * ((top - bottom) / ni)
+    return x, y
+
+
+def digitize_lines(pix, color, max_dist, eps2=1., min_pixels=5, extent=None,
+                   origin='upper', **invert_kw):
+    """
+    Automatically digitize the curves drawn in one color in a line plot.
+
+    The pipeline is: color_mask finds the pixels of the series, mask2paths
+    thins them to skeleton curves, orders and simplifies them, and
+    pixel_to_data converts the vertexes to data coordinates.
+
+    Parameters
+    ----------
+    pix : array_like, shape=(ni, nj, nc)
+        image of the plot area
+    color : array_like, shape=(nc,)
+        color of the series to digitize
+    max_dist : float
+        largest distance from `color` to count as part of the series, see
+        color_mask
+    eps2 : number, optional
+        (max allowable distance)**2, in pixels, when simplifying the curves
+    min_pixels : int, optional
+        shortest curve, in pixels, to keep
+    extent : sequence, optional
+        (left, right, bottom, top) of `pix` in data coordinates, see
+        pixel_to_data
+    origin : {'upper', 'lower'}, optional
+        whether row 0 of `pix` is at the top or bottom of the plot
+    **invert_kw : optional
+        passed to color_mask
+
+    Returns
+    -------
+    offsets : ndarray, shape=(ncurves+1,)
+        the points of curve k are x[offsets[k]:offsets[k+1]], and likewise y
+    x, y : ndarray
+        data coordinates of the points of every curve, one after another
+    """
+    pix = np.asarray(pix)
+    mask = color_mask(pix, color, max_dist, **invert_kw)
+    offsets, ii, jj = mask2paths(mask, eps2=eps2, min_pixels=min_pixels)
+    x, y = pixel_to_data(ii, jj, pix.shape, extent=extent, origin=origin)
+    return offsets, x, y
+
+
+def block_rows(nj, nc, max_memory, pixel_bytes=None):
+    """
+    Number of image rows that invert_cmap can process at once while keeping
+    its temporaries under `max_memory` bytes.
+
+    `pixel_bytes` is the temporary memory needed per pixel, e.g. from
+    CmapIndex.pixel_bytes.  By default each pixel needs roughly a float64
+    copy of its color plus float64/intp distance, index, and result values.
+    """
+    if pixel_bytes is None:
+        pixel_bytes = 8 * (nc + 4)
+    per_row = nj * pixel_bytes
+    return max(1, int(max_memory // per_row))
+
+
+def get_cmap_index(l, colors, metric='rgb', cache=TREE_CACHE):
+    """
+    Return a CmapIndex of `colors`, reusing a cached index when a colormap
+    with the same contents has been seen before.
+
+    Parameters
+    ----------
+    l : array_like, shape=(N,)
+        normalized location of colors
+    colors : array_like, shape=(N, nc)
+        sequence of colors at each point in l
+    metric : str, optional
+        color distance, see CmapIndex
+    cache : LRUCache or None, optional
+        where to look for (and store) the index.  None disables caching.
+
+    Returns
+    -------
+    index : CmapIndex
+    """
+    colors = np.asarray(colors)
+    if cache is None:
+        return CmapIndex(colors, metric=metric)
+    return cache.get((metric, content_key(l, colors)),
+                     lambda: CmapIndex(colors, metric=metric))
+
+
+class CmapIndex(object):
+    """
+    Nearest-color search structures for one colormap.
+
+    Parameters
+    ----------
+    colors : array_like, shape=(N, nc)
+        sequence of colors in the colormap
+    metric : {'rgb', 'cie76', 'ciede94', 'ciede2000', 'cmc'}, optional
+        color distance to minimize.  For everything but 'rgb', colors are
+        converted to Lab space and the tree is built there.
+
+    Attributes
+    ----------
+    colors : ndarray, shape=(N, nc)
+        sequence of colors in the colormap
+    metric : str
+        color distance to minimize
+    tree : scipy.spatial.cKDTree
+        tree of `colors` (in Lab space for the Lab based metrics)
+    candidates : int
+        number of nearest colors in Lab space re-ranked by the 'ciede94',
+        'ciede2000', and 'cmc' metrics
+    luts : dict
+        lookup tables from packed 24-bit RGB to the index of the closest
+        color in `colors`, keyed by the pixel scale (1 for uint8, 255 for
+        float) and alpha value.  Entries equal to LUT_EMPTY have not been
+        computed yet.  max_dist is applied after the lookup, so it does not
+        need a table of its own.
+    """
+    LUT_EMPTY = np.iinfo(np.uint16).max
+    METRICS = {
+        'rgb': None,
+        'cie76': deltaE_cie76,
+        'ciede94': deltaE_ciede94,
+        'ciede2000': deltaE_ciede2000,
+        'cmc': deltaE_cmc,
+    }
+    #: float64 temporaries per pixel and candidate while re-ranking, measured
+    #: with tracemalloc (ciede2000 has the most intermediate terms)
+    RERANK_TEMPORARIES = {
+        'ciede94': 16,
+        'ciede2000': 40,
+        'cmc': 24,
+    }
+    #: likewise while projecting onto candidate segments in curve_query
+    CURVE_TEMPORARIES = 14
+
+    def __init__(self, colors, metric='rgb'):
+        if metric not in self.METRICS:
+            raise ValueError('unknown metric %r' % (metric,))
+        self.colors = np.asarray(colors)
+        self.metric = metric
+        self.candidates = 8
+        if metric == 'rgb':
+            self._coords = self.colors
+        else:
+            self._coords = rgb_to_lab(self.colors)
+        self.tree = cKDTree(self._coords)
+        self.luts = {}
+        self._segments = None
+
+    def pixel_bytes(self, nc, interpolate=False):
+        """
+        Approximate bytes of temporaries needed per pixel by tree_query, or
+        by curve_query if `interpolate`, for sizing blocks with block_rows.
+        """
+        per_pixel = nc + 4
+        if self.metric != 'rgb':
+            # Lab conversion
+            per_pixel += 8
+        if interpolate:
+            per_pixel += self.CURVE_TEMPORARIES * self.candidates
+        elif self.metric in self.RERANK_TEMPORARIES:
+            per_pixel += (self.RERANK_TEMPORARIES[self.metric] *
+                          self.candidates)
+        return 8 * per_pixel
+
+    def tree_query(self, pix, max_dist=None):
+        """
+        Index of the closest color to each pixel in `pix`, shape=(M, nc).
+        Pixels farther than `max_dist` from every color get index N.
+        """
+        if max_dist is None:
+            bound = np.inf
+        else:
+            # the tree only returns neighbors strictly closer than its bound;
+            # a color exactly max_dist away is not "farther than" max_dist
+            bound = np.nextafter(max_dist, np.inf)
+        if self.metric == 'rgb':
+            d, i = self.tree.query(pix, distance_upper_bound=bound)
+            return i
+
+        lab = rgb_to_lab(pix)
+        k = min(self.candidates, len(self.colors))
+        if self.metric == 'cie76':
+            d, i = self.tree.query(lab, distance_upper_bound=bound)
+            return i
+        # cheap Euclidean pre-filter in Lab, exact deltaE on the survivors.
+        # No distance bound here: deltaE can be much smaller than the
+        # Euclidean distance, so bounding the pre-filter could lose matches.
+        d, i = self.tree.query(lab, k=k)
+        i = i.reshape((len(lab), k))
+        dE = self.METRICS[self.metric](self._coords[i], lab[:, None, :])
+        best = np.argmin(dE, axis=1)
+        rows = np.arange(len(i))
+        i = i[rows, best]
+        i[dE[rows, best] > bound] = len(self.colors)
+        return i
+
+    def curve_query(self, pix, max_dist=None):
+        """
+        Fractional index of the closest point on the polyline through
+        `colors` to each pixel in `pix`, shape=(M, nc).  Pixels farther than
+        `max_dist` from the polyline get NaN.
+
+        Candidate segments are the CmapIndex.candidates segments with the
+        closest midpoints.  Each pixel is projected onto each candidate and
+        the closest projection wins.
+        """
+        n = len(self.colors)
+        if n < 2:
+            i = self.tree_query(pix, max_dist=max_dist)
+            position = i.astype(float)
+            position[i == n] = np.nan
+            return position
+        if self._segments is None:
+            a = np.asarray(self._coords[:-1], dtype=float)
+            ab = np.asarray(self._coords[1:], dtype=float) - a
+            ab2 = np.sum(ab ** 2, axis=1)
+            ab2[ab2 == 0] = 1.  # repeated colors: any t projects the same
+            self._segments = a, ab, ab2, cKDTree(a + 0.5 * ab)
+        a, ab, ab2, midtree = self._segments
+
+        p = np.asarray(pix if self.metric == 'rgb' else rgb_to_lab(pix),
+                       dtype=float)
+        k = min(self.candidates, n - 1)
+        d, seg = midtree.query(p, k=k)
+        seg = seg.reshape((len(p), k))
+
+        ap = p[:, None, :] - a[seg]
+        t = np.sum(ap * ab[seg], axis=2) / ab2[seg]
+        np.clip(t, 0, 1, out=t)
+        ap -= t[:, :, None] * ab[seg]
+        d2 = np.sum(ap ** 2, axis=2)
+
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(p))
+        position = seg[rows, best] + t[rows, best]
+        if max_dist is not None:
+            position[d2[rows, best] > max_dist ** 2] = np.nan
+        return position
+
+    def unique_query(self, pix, max_dist=None, query=None):
+        """
+        Index of the closest color to each pixel in `pix`, shape=(M, nc),
+        querying the tree once per distinct color.  `query` is the per-color
+        query to use and defaults to tree_query.
+        """
+        query = self.tree_query if query is None else query
+        packed = pack_colors(pix)
+        _, first, inverse = np.unique(packed, return_index=True,
+                                      return_inverse=True)
+        i = query(pix[first], max_dist=max_dist)
+        return i[inverse.ravel()]
+
+    def lut_query(self, pix, max_dist=None):
+        """
+        Index of the closest color to each 8-bit pixel, using (and filling
+        in) a lookup table.
+
+        Parameters
+        ----------
+        pix : array_like, shape=(M, nc)
+            RGB or RGBA pixels.  Must be uint8, or floats that are exactly
+            k/255.  RGBA pixels must all have the same alpha.
+        max_dist : float, optional
+            pixels farther than this from every color get index N
+
+        Returns
+        -------
+        i : ndarray, shape=(M,)
+            index of the closest color in `colors`
+        """
+        pix = np.asarray(pix)
+        m, nc = pix.shape
+        if nc not in (3, 4):
+            raise ValueError('lookup tables need RGB or RGBA pixels')
+        if len(self.colors) >= self.LUT_EMPTY:
+            raise ValueError('too many colors for a uint16 lookup table')
+        if pix.dtype == np.uint8:
+            pix8, scale = pix, 1
+        else:
+            pix8, scale = _as_exact_uint8(pix), 255
+            if pix8 is None:
+                raise ValueError('lookup tables need 8-bit pixels')
+        alpha = None
+        if nc == 4 and m:
+            alpha = pix8[0, 3]
+            if not (pix8[:, 3] == alpha).all():
+                raise ValueError('lookup tables need a uniform alpha')
+            pix8 = pix8[:, :3]
+
+        key = (scale, alpha)
+        lut = self.luts.get(key)
+        if lut is None:
+            # fill before publishing: other worker threads may be reading
+            # the table.  setdefault keeps the first one if threads race.
+            lut = np.full(1 << 24, self.LUT_EMPTY, dtype=np.uint16)
+            lut = self.luts.setdefault(key, lut)
+
+        packed = pack_colors(pix8)
+        i = lut[packed]
+        empty = i == self.LUT_EMPTY
+        unpack = partial(_unpack_colors, nc=nc, alpha=alpha, scale=scale,
+                         dtype=pix.dtype)
+        if empty.any():
+            new = np.unique(packed[empty])
+            lut[new] = self.tree_query(unpack(new))
+            i[empty] = lut[packed[empty]]
+        if max_dist is not None and m:
+            # the closest color is within max_dist iff any color is
+            seen, inverse = np.unique(packed, return_inverse=True)
+            far = self.distance(unpack(seen), lut[seen]) > max_dist
+            i = np.where(far[inverse.ravel()], len(self.colors), i)
+        return i
+
+    def distance(self, pix, i):
+        """
+        Distance, in units of the metric, between each pixel in `pix`,
+        shape=(M, nc), and the color with index `i` in `colors`.
+        """
+        if self.metric == 'rgb':
+            d = np.asarray(pix, dtype=float) - self.colors[i]
+            return np.sqrt(np.sum(d ** 2, axis=1))
+        return self.METRICS[self.metric](self._coords[i], rgb_to_lab(pix))
+
+
+def _unpack_colors(packed, nc, alpha=None, scale=1, dtype=np.uint8):
+    """Inverse of pack_colors for 8-bit pixels, on the scale of the image"""
+    rgb = np.empty((len(packed), nc), dtype=np.uint8)
+    rgb[:, 0] = packed >> 16
+    rgb[:, 1] = (packed >> 8) & 0xff
+    rgb[:, 2] = packed & 0xff
+    if alpha is not None:
+        rgb[:, 3] = alpha
+    if scale != 1:
+        rgb = np.asarray(rgb / scale, dtype=dtype)
+    return rgb
+
+
+def pack_colors(pix):
+    """
+    Pack each color into a single scalar, so that colors can be compared,
+    sorted, and de-duplicated as 1d arrays.
+
+    uint8 colors with up to 4 channels are packed into a uint32 (for RGB,
+    ``r << 16 | g << 8 | b``).  So are float colors that are exactly k/255
+    (as returned by plt.imread for 8-bit images).  Other colors are viewed
+    as an opaque fixed-width byte string.
+
+    Parameters
+    ----------
+    pix : array_like, shape=(N, nc)
+        sequence of colors
+
+    Returns
+    -------
+    packed : ndarray, shape=(N,)
+        one scalar per color.  Two colors are equal iff their packed values
+        are equal.
+    """
+    pix = np.ascontiguousarray(pix)
+    n, nc = pix.shape
+    if pix.dtype.kind == 'f' and nc <= 4:
+        pix8 = _as_exact_uint8(pix)
+        if pix8 is not None:
+            return pack_colors(pix8)
+    if pix.dtype == np.uint8 and nc <= 4:
+        packed = np.zeros(n, dtype=np.uint32)
+        for c in range(nc):
+            packed <<= 8
+            packed |= pix[:, c]
+        return packed
+    return pix.view(np.dtype((np.void, pix.dtype.itemsize * nc))).ravel()
+
+
+def rgb_to_lab(rgb):
+    """
+    Convert a sequence of RGB(A) colors to CIE Lab.  Alpha is ignored.
+
+    Parameters
+    ----------
+    rgb : array_like, shape=(N, nc)
+        uint8 colors, or float colors on [0, 1]
+
+    Returns
+    -------
+    lab : ndarray, shape=(N, 3)
+    """
+    rgb = np.asarray(rgb)[:, :3]
+    return rgb2lab(rgb.reshape((-1, 1, 3))).reshape((-1, 3))
+
+
+def _as_exact_uint8(pix):
+    """Convert float colors to uint8 if that can be done without losing
+    information, otherwise return None"""
+    if not len(pix):
+        return None
+    q = np.round(pix * 255)
+    if q.min() < 0 or q.max() > 255:
+        return None
+    if not (np.asarray(q / 255, dtype=pix.dtype) == pix).all():
+        return None
+    return q.astype(np.uint8)
 
 
 def order_corners(corners):
@@ -51,6 +642,10 @@ def get_corner_grid(corners, ni, nj):
     """
     Get uniform grid between corners
 
+    The grid is the bilinear map of the quadrilateral onto an (ni, nj) grid
+    of cell centers: the second index runs from the left edge to the right
+    edge, and the first index from the bottom edge to the top edge.
+
     Parameters
     ----------
     corners : list
@@ -67,36 +662,93 @@ def get_corner_grid(corners, ni, nj):
     y : ndarray, shpae=(ni, nj)
         grid of second dimension coordinates
     """
-    bl, br, tr, tl = order_corners(corners)
-    x = np.zeros((ni, nj))
+    return _corner_grid_rows(order_corners(corners), ni, nj, 0, ni)
 
-    left_x = _midspace(tl[0], bl[0], ni)
-    right_x = _midspace(tr[0], br[0], ni)
 
-    bot_y = _midspace(bl[1], br[1], nj)
-    top_y = _midspace(tl[1], tr[1], nj)
+def _grid_fractions(k, n, endpoints):
+    """fractions along an edge for grid indexes k of n: cell midpoints, or
+    evenly spaced from one corner to the other when `endpoints`"""
+    if endpoints:
+        return k / max(n - 1, 1)
+    return (k + 0.5) / n
 
-    di = 1. / ni
-    dj = 1. / nj
-    ispan = np.arange(di / 2, 1., di)
-    jspan = np.arange(dj / 2, 1., dj)
 
-    x = np.empty((ni, nj))
-    x[:, :] = jspan
-    x *= (right_x - left_x)[:, None]
-    x += left_x[:, None]
-
-    y = np.empty((ni, nj))
-    y[:, :] = ispan[:, None]
-    y *= (top_y - bot_y)
-    y += bot_y
-    return x, y
+def _corner_grid_rows(ordered, ni, nj, i0, i1, endpoints=False):
+    """rows i0:i1 of get_corner_grid, for corners already ordered"""
+    bl, br, tr, tl = [np.asarray(c, dtype=float) for c in ordered]
+    t = _grid_fractions(np.arange(i0, i1), ni, endpoints)[:, None, None]
+    s = _grid_fractions(np.arange(nj), nj, endpoints)[None, :, None]
+    bottom = bl + s * (br - bl)
+    top = tl + s * (tr - tl)
+    xy = bottom + t * (top - bottom)
+    return xy[..., 0], xy[..., 1]
 
 
-def _midspace(start, end, n):
+def warp_corners(im, corners, shape=None, order=1, max_memory=None):
     """
-    Cut region start/end into n regions and return the midpoint of each bin
+    Resample the quadrilateral region of an image between `corners` onto a
+    rectangular grid, deskewing and cropping in one step.
+
+    Only the output pixels are interpolated, in a single map_coordinates
+    call per block of output rows, rather than rotating the whole image and
+    cropping afterwards.
+
+    Parameters
+    ----------
+    im : ndarray, shape=(ni, nj) or (ni, nj, nc)
+        image to resample
+    corners : sequence
+        four (row, column) pixel coordinates, in any order, e.g. from
+        guess.guess_corners.  The frame should be rotated by well under 45
+        degrees.
+    shape : tuple, optional
+        (rows, columns) of the output, sampled at the centers of a grid of
+        cells that spans the quadrilateral.  By default there is one sample
+        per pixel along the mean lengths of opposite sides, with the first
+        and last samples on the corners, so an axis-aligned frame gives
+        exactly the pixels between its corners.
+    order : int, optional
+        order of the spline interpolation
+    max_memory : int, optional
+        approximate limit, in bytes, on the temporary arrays.  The output is
+        computed in blocks of rows that fit in the limit.  By default the
+        whole output is done in one block.
+
+    Returns
+    -------
+    warped : ndarray, shape=(rows, columns) or (rows, columns, nc)
+        the plot region, in the dtype of `im`
     """
-    x = np.linspace(start, end, n + 1)
-    x = x[:-1] + np.diff(x)
-    return x
+    im = np.asarray(im)
+    ni = im.shape[0]
+    # (x, y) with y up, so order_corners sees the usual orientation
+    xy = [(j, ni - 1 - i) for i, j in corners]
+    ordered = order_corners(xy)
+    bl, br, tr, tl = [np.asarray(c, dtype=float) for c in ordered]
+    endpoints = shape is None
+    if endpoints:
+        rows = 0.5 * (np.hypot(*(tl - bl)) + np.hypot(*(tr - br)))
+        cols = 0.5 * (np.hypot(*(br - bl)) + np.hypot(*(tr - tl)))
+        shape = int(round(rows)) + 1, int(round(cols)) + 1
+    nrows, ncols = shape
+
+    nc = im.shape[2] if im.ndim == 3 else 1
+    out = np.empty((nrows, ncols) + im.shape[2:], dtype=im.dtype)
+    if max_memory is None:
+        block = nrows
+    else:
+        # float64 coordinates (2 or 3 per value) and result per value
+        block = max(1, int(max_memory // (ncols * nc * 8 * (im.ndim + 1))))
+
+    for r0 in range(0, nrows, block):
+        r1 = min(r0 + block, nrows)
+        # output row 0 is the top edge, i.e. the last row of the grid
+        x, y = _corner_grid_rows(ordered, nrows, ncols,
+                                 nrows - r1, nrows - r0, endpoints)
+        coords = [ni - 1 - y[::-1], x[::-1]]
+        if im.ndim == 3:
+            coords = [np.repeat(c[..., None], nc, axis=-1) for c in coords]
+            coords.append(np.broadcast_to(np.arange(nc), coords[0].shape))
+        out[r0:r1] = map_coordinates(im, coords, order=order, mode='nearest',
+                                     output=im.dtype)
+    return out
@@ -3,6 +3,7 @@ from collections import OrderedDict
 
 from .widgets import (DeformableLine, ShutterCrop, NothingWidget, CroppedImage,
                       ShadowLine)
+from .interp import digitize_lines
 
 import numpy as np
 from matplotlib.widgets import RadioButtons, Button
@@ -33,6 +34,10 @@ class LineExtractor(object):
     dump_button
     dump_func
     path
+    auto_lines : tuple | None
+        (offsets, x, y) curves found by digitize_color, in data coordinates
+    auto_artists : list
+        Line2Ds drawing auto_lines on the annotation axes
 
     """
     def __init__(self, pixels, path):
@@ -102,6 +107,43 @@ class LineExtractor(object):
         self.dump_button.on_clicked(self.dump)
 
         self.path = path
+        self.auto_lines = None
+        self.auto_artists = []
+
+    def digitize_color(self, color, max_dist, **digitize_kw):
+        """
+        Automatically digitize the curves drawn in `color` in the cropped
+        image, and draw them over it.  See interp.digitize_lines.
+
+        Parameters
+        ----------
+        color : array_like
+            color of the series, on the same scale as the pixels
+        max_dist : float
+            largest distance from `color` to count as part of the series
+        **digitize_kw : optional
+            passed to digitize_lines, e.g. eps2, min_pixels, or metric
+
+        Returns
+        -------
+        offsets, x, y : ndarray
+            the curves, see digitize_lines
+        """
+        image = self.cropped_img.image
+        self.auto_lines = digitize_lines(image.get_array(), color, max_dist,
+                                         extent=image.get_extent(),
+                                         origin=image.origin,
+                                         **digitize_kw)
+        offsets, x, y = self.auto_lines
+
+        ax = self.ann_axes['img']
+        for artist in self.auto_artists:
+            artist.remove()
+        self.auto_artists = [
+            ax.plot(x[i0:i1], y[i0:i1], 'o-', color='k', alpha=0.5)[0]
+            for i0, i1 in zip(offsets[:-1], offsets[1:])]
+        self.ann_fig.canvas.draw()
+        return self.auto_lines
 
     def create_selector_toggle(self):
         self.selector_widgets = OrderedDict()
@@ -185,12 +227,39 @@ class LineExtractor(object):
         return fig, axes
 
     def get_data(self):
+        """Return the manually picked and automatically digitized curves.
+
+        Returns
+        -------
+        dict : Dictionary with the following keys/values
+            line_x, line_y : array
+                vertexes of the manual segmented line, in data coordinates
+            points_x, points_y : array
+                the manual points, in data coordinates
+            x : array
+                x coordinates of the points of every curve found by
+                digitize_color.  Only present after digitize_color.
+            y : array
+                y coordinates of the points of every curve, likewise
+            offsets : array
+                the points of curve k are x[offsets[k]:offsets[k+1]]
+        """
         data = {}
-        data['x'] = None
-        data['y'] = None
-        raise NotImplemented
+        data['line_x'], data['line_y'] = self._shadow_data(self.line_shadow)
+        data['points_x'], data['points_y'] = self._shadow_data(
+            self.points_shadow)
+        if self.auto_lines is not None:
+            data['offsets'], data['x'], data['y'] = self.auto_lines
         return data
 
+    def _shadow_data(self, shadow):
+        """Data coordinates of a ShadowLine, which is drawn in axes
+        coordinates over the cropped image"""
+        shadow.update()
+        a, b = (np.asarray(v, dtype=float) for v in shadow.line.get_data())
+        x0, x1, y0, y1 = self.cropped_img.image.get_extent()
+        return x0 + a * (x1 - x0), y0 + b * (y1 - y0)
+
     def dump_npz(self):
         data = self.get_data()
         print('dumping to', self.path)
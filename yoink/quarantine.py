@@ -5,10 +5,10 @@ from __future__ import division, print_function
 from matplotlib.widgets import Widget
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import ndimage
 from skimage.feature import corner_harris
 
-from .guess import guess_corners, mean_rotation, clear_border
+from .guess import guess_corners, guess_frame
+from .interp import warp_corners
 from .data import rotated_lena, rotated_parabola
 from .widgets import if_attentive
 
@@ -91,20 +91,16 @@ def lena_example():
 
     # find corners on grayscale image
     # use negative so that boundary is 0
-    bw = im[:, :, 0]
-    bw = 255 - bw
+    bw = 1 - im[:, :, 0]
 
-    corners, outline = guess_corners(bw)
-    angle = mean_rotation(corners) * 180./np.pi
-    im2 = clear_border(im, outline)
-    im2 = ndimage.rotate(im, angle, reshape=False, mode='nearest')
-    cropped = keyboard_crop(im2)
+    corners, outline = guess_corners(bw, max_pixels=250000)
+    # deskew and crop in one resampling of the plot region
+    cropped = warp_corners(im, corners)
 
-    fig, (ax1, ax2, ax3) = plt.subplots(3)
+    fig, (ax1, ax2) = plt.subplots(2)
     ax1.imshow(im)
     ax1.plot(corners[:, 1], corners[:, 0], 'o')
-    ax2.imshow(im2)
-    ax3.imshow(cropped)
+    ax2.imshow(cropped)
 
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2)
     ax1.imshow(cropped[:20, :20])
@@ -119,20 +115,16 @@ def parabola_example():
 
     # find corners on grayscale image
     # use negative so that boundary is 0
-    bw = im[:, :, 0]
-    bw = 255 - bw
+    bw = 1 - im[:, :, 0]
 
-    corners, outline = guess_corners(bw)
-    angle = mean_rotation(corners)
-    im2 = clear_border(im, outline)
-    im2 = ndimage.rotate(im, angle, reshape=False, mode='nearest')
-    cropped = keyboard_crop(im2)
+    corners, outline = guess_frame(bw, angles=np.arange(-20, 20.1, 0.25))
+    # deskew and crop in one resampling of the plot region
+    cropped = warp_corners(im, corners)
 
-    fig, (ax1, ax2, ax3) = plt.subplots(3)
+    fig, (ax1, ax2) = plt.subplots(2)
     ax1.imshow(im)
     ax1.plot(corners[:, 1], corners[:, 0], 'o')
-    ax2.imshow(im2)
-    ax3.imshow(cropped)
+    ax2.imshow(cropped)
 
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2)
     ax1.imshow(cropped[:20, :20])
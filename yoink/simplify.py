@@ -1,9 +1,11 @@
 """Functions for simplifying line segments"""
 from __future__ import division
+from heapq import heapify, heappop, heappush
+from math import sqrt
 
 import numpy as np
 from skimage import img_as_bool
-#from skimage.morphology import skeletonize
+from skimage.morphology import skeletonize
 
 
 def rdp_indexes(points, eps2, dist2=None):
@@ -25,6 +27,10 @@ def rdp_indexes(points, eps2, dist2=None):
     indexes : list
         sorted list of indexes of kept points
 
+    See Also
+    --------
+    rdp_indexes_batch : simplify many lines at once
+
     References
     ----------
     .. [1] http://en.wikipedia.org/wiki/Ramer-Douglas-Peucker_algorithm
@@ -36,17 +42,17 @@ def rdp_indexes(points, eps2, dist2=None):
            caricature", The Canadian Cartographer 10(2), 112-122 (1973)
            doi:10.3138/FM57-6770-U75U-7727
     """
-    dist2 = point_line_dist2 if dist2 is not None else point_line_dist2
-
+    points = np.asarray(points)
     N = len(points)
-    keep = [0, N-1]
+    if dist2 is None:
+        offsets, indexes = rdp_indexes_batch(points, [0, N], eps2)
+        return indexes.tolist()
 
+    keep = np.zeros(N, dtype=bool)
+    if N:
+        keep[[0, -1]] = True
     stack = [(0, N-1)]
-
-    for i in xrange(N**2):
-        if not stack:
-            return sorted(keep)
-
+    while stack:
         i0, i1 = stack.pop()
         if i1 <= i0+1:
             continue
@@ -57,10 +63,232 @@ def rdp_indexes(points, eps2, dist2=None):
         i += i0 + 1
 
         if dmax > eps2:
-            keep.append(i)
+            keep[i] = True
             stack += [(i0, i), (i, i1)]
+    return np.flatnonzero(keep).tolist()
+
+
+def rdp_indexes_batch(points, offsets, eps2):
+    """
+    Ramer-Douglas-Peucker simplification of many lines at once.
+
+    Rather than recursing into one span at a time, every span of every line
+    that still needs splitting is handled together, so the number of Python
+    level steps is the depth of the recursion rather than the number of
+    kept points.
+
+    Parameters
+    ----------
+    points : array_like
+        (n, m) points of every line, one line after another
+    offsets : array_like
+        (nlines+1,) line k is points[offsets[k]:offsets[k+1]]
+    eps2 : number
+        (max allowable distance)**2
+
+    Returns
+    -------
+    offsets : ndarray, shape=(nlines+1,)
+        the indexes kept from line k are indexes[offsets[k]:offsets[k+1]]
+    indexes : ndarray
+        sorted indexes of the kept points of each line, counted from the
+        start of that line, one line after another
+    """
+    # one contiguous array per dimension makes the gathers below cheap
+    coords = np.array(points, dtype=float, ndmin=2).T.copy()
+    offsets = np.asarray(offsets, dtype=int)
+    first, last = offsets[:-1], offsets[1:] - 1
+    nonempty = last >= first
+
+    keep = np.zeros(coords.shape[1], dtype=bool)
+    i0, i1 = first[nonempty], last[nonempty]
+    keep[i0] = True
+    keep[i1] = True
+    while True:
+        split = i1 - i0 > 1
+        i0, i1 = i0[split], i1[split]
+        if not len(i0):
+            break
+
+        # the interior points of every span, and the span each belongs to
+        n = i1 - i0 - 1
+        span_start = np.zeros(len(n), dtype=int)
+        np.cumsum(n[:-1], out=span_start[1:])
+        span = np.repeat(np.arange(len(n)), n)
+        i = np.arange(span_start[-1] + n[-1])
+        i += (i0 + 1 - span_start)[span]
+
+        d = _dist2([c[i] - c[i0][span] for c in coords],
+                   [(c[i1] - c[i0])[span] for c in coords])
+
+        # first point of each span that is furthest from the span's line
+        dmax = np.maximum.reduceat(d, span_start)
+        far = np.flatnonzero(d == dmax[span])
+        far = far[np.concatenate(([True], span[far][1:] != span[far][:-1]))]
+
+        split = dmax > eps2
+        im = i[far][split]
+        keep[im] = True
+        i0, i1 = np.concatenate((i0[split], im)), np.concatenate((im, i1[split]))
+
+    kept = np.flatnonzero(keep)
+    line = np.searchsorted(offsets, kept, side='right') - 1
+    new_offsets = np.searchsorted(kept, offsets)
+    return new_offsets, kept - offsets[line]
+
+
+def vw_indexes(points, n=None, area=None):
+    """Indexes of points kept using the Visvalingam-Whyatt algorithm.
+
+    Repeatedly drops the point whose triangle with its two neighbors has
+    the least area (its "effective area"), until `n` points remain or every
+    remaining point has an effective area greater than `area`.  A heap of
+    effective areas makes this O(n log n), and lets the output size be set
+    exactly, unlike rdp_indexes.
+
+    Parameters
+    ----------
+    points : array_like
+        (n, m) n points in m dimensions
+    n : int, optional
+        number of points to keep.  At least 2; the end points are always
+        kept.
+    area : number, optional
+        largest effective area to drop.  Defaults to 0, which only drops
+        points that lie on the line between their neighbors, if `n` is not
+        given either.
+
+    Returns
+    -------
+    indexes : list
+        sorted list of indexes of kept points
+
+    References
+    ----------
+    .. [1] http://en.wikipedia.org/wiki/Visvalingam-Whyatt_algorithm
+    .. [2] M. Visvalingam & J. D. Whyatt, "Line generalisation by repeated
+           elimination of points", The Cartographic Journal 30(1), 46-51
+           (1993) doi:10.1179/000870493786962263
+    """
+    points = np.asarray(points, dtype=float)
+    N = len(points)
+    if n is None and area is None:
+        area = 0
+    n = 2 if n is None else max(n, 2)
+    area = np.inf if area is None else area
+    if N <= n:
+        return list(range(N))
+
+    # effective area of every interior point at once; later updates are
+    # one point at a time, so use plain floats for them
+    areas = [np.inf] * N
+    areas[1:-1] = _triangle_area(points[:-2], points[1:-1], points[2:]).tolist()
+    points = points.tolist()
+    before = list(range(-1, N - 1))
+    after = list(range(1, N + 1))
+    kept = bytearray([1]) * N
+
+    heap = [(a, i) for i, a in enumerate(areas)]
+    heapify(heap)
+    remaining = N
+    largest = 0.
+    while remaining > n:
+        a, i = heappop(heap)
+        if not kept[i] or a != areas[i]:
+            # stale entry for a point that was dropped or updated
+            continue
+        if a > area:
+            break
+        kept[i] = 0
+        remaining -= 1
+        # a neighbor's area never drops below that of a point already
+        # dropped, so that points are dropped in a consistent order
+        largest = max(largest, a)
+        p, q = before[i], after[i]
+        after[p], before[q] = q, p
+        for j in (p, q):
+            if 0 < j < N - 1:
+                areas[j] = max(_triangle_area1(points[before[j]], points[j],
+                                               points[after[j]]), largest)
+                heappush(heap, (areas[j], j))
+    return [i for i in range(N) if kept[i]]
+
+
+def _triangle_area(a, b, c):
+    """Areas of the triangles (a, b, c), for (N, M) arrays of points"""
+    u = b - a
+    v = c - a
+    uu = np.einsum('ij,ij->i', u, u)
+    vv = np.einsum('ij,ij->i', v, v)
+    uv = np.einsum('ij,ij->i', u, v)
+    return 0.5 * np.sqrt(np.maximum(uu * vv - uv * uv, 0))
+
 
-    assert False
+def _triangle_area1(a, b, c):
+    """Area of a single triangle (a, b, c), for sequences of floats"""
+    uu = vv = uv = 0.
+    for ai, bi, ci in zip(a, b, c):
+        u = bi - ai
+        v = ci - ai
+        uu += u * u
+        vv += v * v
+        uv += u * v
+    return 0.5 * sqrt(max(uu * vv - uv * uv, 0.))
+
+
+def opening_window(points, eps2, max_window=1024):
+    """Simplify a stream of points with the opening window algorithm.
+
+    Points are consumed one at a time, and kept points are yielded as soon
+    as they are known, so arbitrarily long traces (e.g. a generator over
+    the output of img2paths) are simplified in bounded memory.
+
+    Starting from an anchor point, the window opens to include each new
+    point as long as the line from the anchor to that point passes within
+    sqrt(eps2) of every point in between.  When it does not, the previous
+    point is kept and becomes the new anchor.  A window that reaches
+    `max_window` points is closed early the same way.
+
+    Parameters
+    ----------
+    points : iterable
+        sequence of m-dimensional points, e.g. zip(iseq, jseq)
+    eps2 : number
+        (max allowable distance)**2
+    max_window : int, optional
+        most points held at once
+
+    Yields
+    ------
+    index : int
+        position of the kept point in `points`
+    point : ndarray, shape=(m,)
+        the kept point
+
+    References
+    ----------
+    .. [1] J. Sklansky & V. Gonzalez, "Fast polygonal approximation of
+           digitized curves", Pattern Recognition 12(5), 327-331 (1980)
+           doi:10.1016/0031-3203(80)90031-X
+    """
+    window = None
+    n = 0
+    for i, p in enumerate(points):
+        p = np.asarray(p, dtype=float)
+        if window is None:
+            window = np.empty((max_window, len(p)))
+            anchor = p
+            yield i, p
+            continue
+        if n and (n == max_window or
+                  point_line_dist2(window[:n], anchor, p).max() > eps2):
+            anchor = window[n - 1].copy()
+            yield i - 1, anchor
+            n = 0
+        window[n] = p
+        n += 1
+    if n:
+        yield i, window[n - 1].copy()
 
 
 def point_line_dist2(p, l1, l2):
@@ -81,11 +309,37 @@ def point_line_dist2(p, l1, l2):
         distance**2 between each point and line. shape == N
     """
     p, l1, l2 = np.asarray(p), np.asarray(l1), np.asarray(l2)
-    ap = l1 - p
+    ap = p - l1
     n = l2 - l1
-    n /= np.sqrt(sum(n**2))
-    dist = ap - np.outer(n, np.dot(ap, n)).T
-    return np.sum(dist**2, 1)
+    nn = np.dot(n, n)
+    d2 = np.einsum('ij,ij->i', ap, ap)
+    if nn > 0:
+        t = np.dot(ap, n)
+        t *= t
+        t /= nn
+        d2 -= t
+    return np.maximum(d2, 0, out=d2)
+
+
+def _dist2(ap, n):
+    """
+    Distance**2 between points and lines through the origin, in one pass:
+    |ap|**2 - (ap . n)**2 / |n|**2.  `ap` and `n` are sequences of the
+    coordinates of the points and the line directions, one entry per
+    dimension.  Zero length `n` gives |ap|**2.
+    """
+    d2 = np.zeros(len(ap[0]))
+    nn = np.zeros(len(ap[0]))
+    t = np.zeros(len(ap[0]))
+    for a, b in zip(ap, n):
+        d2 += a * a
+        nn += b * b
+        t += a * b
+    t *= t
+    np.divide(t, nn, out=t, where=nn > 0)
+    t[nn == 0] = 0
+    d2 -= t
+    return np.maximum(d2, 0, out=d2)
 
 
 def img2line(img):
@@ -102,24 +356,133 @@ def img2line(img):
         1d sequnce of i coordinates
     jseq : array
         1d sequnce of j coordinates
+
+    See Also
+    --------
+    img2paths : the same pixels, ordered along each curve
+    """
+    return np.nonzero(img_as_bool(img))
+
+
+#: offsets to the 8 neighbors of a pixel, edge neighbors first
+NEIGHBORS = [(-1, 0), (0, -1), (0, 1), (1, 0),
+             (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def img2paths(img):
+    """
+    Split the pixels of a thin (e.g. skeletonized) image into curves, each
+    ordered by walking from pixel to 8-connected neighboring pixel.
+
+    Walks start at the end points of curves (pixels with one neighbor),
+    then at whatever pixels remain, such as closed loops.  A walk steps to
+    an unvisited neighbor, preferring edge neighbors to corner neighbors so
+    that staircases are not cut short.  Where curves branch, the walk
+    carries on along one branch and the others become separate curves.
+
+    Parameters
+    ----------
+    img : 2d array_like
+        image to extract curves from
+
+    Returns
+    -------
+    offsets : ndarray, shape=(ncurves+1,)
+        the pixels of curve k are iseq[offsets[k]:offsets[k+1]], and
+        likewise jseq.  Ready for rdp_indexes_batch.
+    iseq : ndarray
+        i coordinates of the pixels of every curve, one after another
+    jseq : ndarray
+        j coordinates of the pixels of every curve, one after another
     """
     img = img_as_bool(img)
-    Ns = sum(img, axis=1)
-    N = sum(Ns)
+    ii, jj = np.nonzero(img)
+    N = len(ii)
+
+    # label every pixel, and look up the labels of its neighbors all at once
+    labels = np.full((img.shape[0] + 2, img.shape[1] + 2), -1, dtype=int)
+    labels[ii + 1, jj + 1] = np.arange(N)
+    neighbors = np.column_stack([labels[ii + 1 + di, jj + 1 + dj]
+                                 for di, dj in NEIGHBORS])
+    count = np.sum(neighbors >= 0, axis=1)
+
+    # the walk itself is sequential, so do it on plain lists
+    neighbors = [[q for q in row if q >= 0] for row in neighbors.tolist()]
+    visited = bytearray(N)
 
-    ni, nj = img.shape
-    jrange = np.arange(nj)
+    def walk(p):
+        path = []
+        while True:
+            visited[p] = 1
+            path.append(p)
+            for q in neighbors[p]:
+                if not visited[q]:
+                    p = q
+                    break
+            else:
+                return path
 
-    iseq = np.zeros(N, dtype=int)
-    jseq = np.zeros(N, dtype=int)
+    paths = []
+    starts = np.concatenate((np.flatnonzero(count == 1), np.arange(N)))
+    for p in starts.tolist():
+        if visited[p]:
+            continue
+        path = walk(p)
+        # a walk that started part way along a curve goes both ways
+        for q in neighbors[p]:
+            if not visited[q]:
+                path = walk(q)[::-1] + path
+                break
+        # close loops
+        if len(path) > 2 and path[0] in neighbors[path[-1]]:
+            path.append(path[0])
+        paths.append(path)
+
+    offsets = np.zeros(len(paths) + 1, dtype=int)
+    np.cumsum([len(path) for path in paths], out=offsets[1:])
+    order = np.array([p for path in paths for p in path], dtype=int)
+    return offsets, ii[order], jj[order]
+
+
+def mask2paths(mask, eps2=1., min_pixels=5):
+    """
+    Trace the curves drawn in a boolean mask, e.g. the pixels of one data
+    series, as simplified polylines.
+
+    The mask is thinned to one pixel wide curves with skeletonize, the
+    curves are ordered with img2paths, curves with fewer than `min_pixels`
+    pixels are dropped, and the rest are simplified together with
+    rdp_indexes_batch.
 
-    ii = iseq
-    jj = jseq
-    for i, n in enumerate(Ns):
-        ii, ii[:n] = ii[:n], i
-        jj, jj[:n] = jj[:n], jrange[img[i, :] == 1]
+    Parameters
+    ----------
+    mask : 2d array_like
+        pixels that belong to the curves
+    eps2 : number, optional
+        (max allowable distance)**2, in pixels, for the simplification
+    min_pixels : int, optional
+        shortest curve (in skeleton pixels) to keep.  Drops specks of noise.
+
+    Returns
+    -------
+    offsets : ndarray, shape=(ncurves+1,)
+        the vertexes of curve k are iseq[offsets[k]:offsets[k+1]], and
+        likewise jseq
+    iseq : ndarray
+        i coordinates of the vertexes of every curve, one after another
+    jseq : ndarray
+        j coordinates of the vertexes of every curve, one after another
+    """
+    offsets, ii, jj = img2paths(skeletonize(img_as_bool(mask)))
 
-    assert not ii
-    assert not jj
+    lengths = np.diff(offsets)
+    long_enough = lengths >= min_pixels
+    pixels = np.repeat(long_enough, lengths)
+    ii, jj = ii[pixels], jj[pixels]
+    offsets = np.zeros(long_enough.sum() + 1, dtype=int)
+    np.cumsum(lengths[long_enough], out=offsets[1:])
 
-    return iseq, jseq
+    kept_offsets, kept = rdp_indexes_batch(np.column_stack((ii, jj)),
+                                           offsets, eps2)
+    kept += np.repeat(offsets[:-1], np.diff(kept_offsets))
+    return kept_offsets, ii[kept], jj[kept]
@@ -0,0 +1,43 @@
+import numpy as np
+
+from yoink.cache import LRUCache, content_key
+
+
+def content_key_test():
+    a = np.arange(10.)
+    assert content_key(a) == content_key(a.copy())
+    assert content_key(a) != content_key(a[::-1])
+    assert content_key(a) != content_key(a.astype(np.float32))
+    assert content_key(a) != content_key(a.reshape((2, 5)))
+
+
+def lru_eviction_test():
+    cache = LRUCache(maxsize=2)
+    cache.get('a', lambda: 1)
+    cache.get('b', lambda: 2)
+    cache.get('a', lambda: None)  # 'a' is now the most recently used
+    cache.get('c', lambda: 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.maxsize = 1
+    assert len(cache) == 1
+    assert 'c' in cache
+
+
+def lru_disabled_test():
+    cache = LRUCache(maxsize=0)
+    assert cache.get('a', lambda: 1) == 1
+    assert len(cache) == 0
+
+
+def lru_set_test():
+    cache = LRUCache(maxsize=2)
+    cache.get('a', lambda: 1)
+    cache.set('a', 2)
+    cache.set('b', 3)
+    cache.set('c', 4)
+    assert 'a' not in cache
+    assert cache.get('c', lambda: None) == 4
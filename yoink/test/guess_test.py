@@ -0,0 +1,66 @@
+import numpy as np
+from numpy.testing import assert_equal, assert_raises
+from scipy import ndimage
+from skimage.transform import rotate
+
+from yoink.guess import guess_corners, guess_frame, downsample, _plot_outline
+from yoink.data import rotated_lena, rotated_parabola
+
+
+def _rotated_frame(ni=300, nj=400, angle=10):
+    frame = np.zeros((ni, nj))
+    frame[60, 80:321] = frame[240, 80:321] = 1
+    frame[60:241, 80] = frame[60:241, 320] = 1
+    return np.clip(1.5 * rotate(frame, angle, order=1), 0, 1)
+
+
+def guess_corners_pyramid_test():
+    bw = _rotated_frame()
+    corners, outline = guess_corners(bw)
+    small_corners, small_outline = guess_corners(bw, max_pixels=bw.size // 9)
+    assert_equal(len(corners), 4)
+    assert_equal(len(small_corners), 4)
+    d = np.hypot(*(small_corners[:, None] - corners[None]).T)
+    # every pyramid corner is a full resolution corner, and vice versa
+    assert d.min(axis=0).max() <= 1
+    assert d.min(axis=1).max() <= 1
+    assert_equal(small_outline.shape, outline.shape)
+    assert (small_outline != outline).mean() < 0.02
+
+
+def guess_corners_pyramid_examples_test():
+    for example in (rotated_lena, rotated_parabola):
+        bw = 1 - example()[:, :, 0]
+        corners, _ = guess_corners(bw, max_pixels=250000)
+        outline = _plot_outline(bw)
+        edge = outline & ~ndimage.binary_erosion(outline)
+        dist = ndimage.distance_transform_edt(~edge)
+        assert dist[corners[:, 0], corners[:, 1]].max() <= 1
+
+
+def guess_corners_blank_test():
+    assert_raises(ValueError, guess_corners, np.zeros((50, 60)))
+
+
+def downsample_test():
+    bw = np.arange(20, dtype=np.uint8).reshape((4, 5))
+    small = downsample(bw, 2)
+    assert_equal(small.dtype, np.uint8)
+    assert_equal(small, [[3, 5, 6], [13, 15, 16]])
+
+
+def guess_frame_test():
+    bw = np.zeros((300, 400))
+    bw[60, 80:321] = bw[240, 80:321] = 1
+    bw[60:241, 80] = bw[60:241, 320] = 1
+    bw[100, 10:60] = 1  # text, or a tick label
+    corners, outline = guess_frame(bw)
+    assert_equal(corners, [[60, 80], [60, 320], [240, 320], [240, 80]])
+    assert_equal(outline.sum(), 181 * 241)
+
+    # a rotated frame needs the angle search
+    bw = _rotated_frame()
+    oracle, _ = guess_corners(bw)
+    corners, outline = guess_frame(bw, angles=np.arange(-15, 15.1, 0.5))
+    d = np.hypot(*(corners[:, None] - oracle[None]).T).min(axis=0)
+    assert d.max() <= 2
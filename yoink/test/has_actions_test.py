@@ -0,0 +1,21 @@
+from yoink.has_actions import Actionable, ActionableMeta
+
+
+def independent_actions_test():
+    Thing = ActionableMeta('Thing', (Actionable,), {
+        'ACTIONS': [('on_release', 'released', 'disconnect_release'),
+                    ('on_changed', 'changed', 'disconnect')],
+    })
+    thing = Thing()
+    calls = []
+    thing.on_release(calls.append, args=('released',))
+    cid = thing.on_changed(calls.append, args=('changed',))
+
+    thing.changed()
+    assert calls == ['changed']
+    thing.released()
+    assert calls == ['changed', 'released']
+
+    thing.disconnect(cid)
+    thing.changed()
+    assert calls == ['changed', 'released']
@@ -1,8 +1,15 @@
 from itertools import permutations
 import numpy as np
+from numpy.testing import assert_allclose, assert_equal
 from nose.tools import ok_
 
-from yoink.interp import order_corners, get_corner_grid, invert_cmap
+from yoink.interp import (order_corners, get_corner_grid, invert_cmap,
+                          pack_colors, block_rows, rgb_to_lab, CmapIndex,
+                          color_mask, pixel_to_data, digitize_lines,
+                          warp_corners, get_cmap_index)
+from yoink.delta_e import (deltaE_cie76, deltaE_ciede94, deltaE_ciede2000,
+                           deltaE_cmc)
+from yoink.cache import LRUCache
 
 
 def order_corners_test():
@@ -18,6 +25,53 @@ def get_corner_grid_test():
     get_corner_grid(corners, ni, nj)
 
 
+def get_corner_grid_midpoints_test():
+    x, y = get_corner_grid([(0, 0), (4, 0), (4, 2), (0, 2)], 2, 4)
+    assert_allclose(x, [[0.5, 1.5, 2.5, 3.5]] * 2)
+    assert_allclose(y, [[0.5] * 4, [1.5] * 4])
+
+
+def warp_corners_crop_test():
+    im = np.random.RandomState(0).rand(30, 40, 3)
+    # (row, column) corners of the region to keep, in any order
+    corners = [(25, 5), (5, 5), (5, 30), (25, 30)]
+    warped = warp_corners(im, corners, order=0)
+    assert_equal(warped.shape, (21, 26, 3))
+    assert_equal(warped.dtype, im.dtype)
+    assert_allclose(warped, im[5:26, 5:31])
+    # the default grid lands on pixel centers, so interpolation is exact
+    assert_allclose(warp_corners(im, corners, order=1), im[5:26, 5:31])
+    assert_allclose(warp_corners(im, corners, order=3), im[5:26, 5:31],
+                    atol=1e-6)
+
+
+def warp_corners_rotated_test():
+    # a checkerboard rotated by 10 degrees about the image center
+    theta = np.deg2rad(10)
+    c, s = np.cos(theta), np.sin(theta)
+    ii, jj = np.mgrid[:200, :200] - 99.5
+    u = c * jj + s * ii
+    v = -s * jj + c * ii
+    im = ((np.floor(u / 20) + np.floor(v / 20)) % 2).astype(float)
+    # corners of the square |u|, |v| <= 60 in (row, column)
+    uv = np.array([(-60, -60), (60, -60), (60, 60), (-60, 60)])
+    corners = [(99.5 + s * a + c * b, 99.5 + c * a - s * b) for a, b in uv]
+    warped = warp_corners(im, corners, shape=(120, 120))
+    expected = ((np.arange(120)[:, None] // 20) +
+                (np.arange(120)[None, :] // 20)) % 2
+    # interpolation only blurs the cell edges
+    ok_((np.abs(warped - expected) > 0.5).mean() < 0.02)
+
+
+def warp_corners_chunked_test():
+    im = np.random.RandomState(1).rand(50, 60)
+    corners = [(3, 4), (45, 8), (48, 55), (5, 50)]
+    whole = warp_corners(im, corners)
+    chunked = warp_corners(im, corners, max_memory=1000)
+    assert_equal(whole.shape, chunked.shape)
+    assert_allclose(whole, chunked)
+
+
 def invert_cmap_test():
     k = 3
     colors = np.ones((20, k))
@@ -30,3 +84,278 @@ def invert_cmap_test():
     assert z.min() >= l[0]
     assert z.max() <= l[-1]
     assert z.shape == (ni, nj)
+
+
+def invert_cmap_cache_test():
+    cache = LRUCache(maxsize=2)
+    l = np.linspace(0, 1, 20)
+    colors = np.ones((20, 3)) * l[:, None]
+    pix = np.random.random((5, 5, 3))
+
+    z1 = invert_cmap(pix, l, colors, cache=cache)
+    z2 = invert_cmap(pix, l.copy(), colors.copy(), cache=cache)
+    assert (z1 == z2).all()
+    assert cache.misses == 1
+    assert cache.hits == 1
+
+    invert_cmap(pix, l, colors[::-1], cache=cache)
+    assert cache.misses == 2
+    assert len(cache) == 2
+
+
+def invert_cmap_unique_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.ones((20, 3)) * l[:, None]
+    palette = np.random.random((7, 3))
+    pix = palette[np.random.randint(0, 7, size=(30, 40))]
+
+    z_tree = invert_cmap(pix, l, colors, method='tree')
+    z_uniq = invert_cmap(pix, l, colors, method='unique')
+    assert z_uniq.shape == (30, 40)
+    assert (z_tree == z_uniq).all()
+
+
+def pack_colors_test():
+    pix = np.array([[1, 2, 3], [1, 2, 3], [3, 2, 1]], dtype=np.uint8)
+    packed = pack_colors(pix)
+    assert packed.dtype == np.uint32
+    assert packed[0] == (1 << 16) | (2 << 8) | 3
+    assert packed[0] == packed[1]
+    assert packed[0] != packed[2]
+
+    packed = pack_colors(pix.astype(float))
+    assert packed[0] == packed[1]
+    assert packed[0] != packed[2]
+
+
+def invert_cmap_lut_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.ones((20, 3)) * l[:, None]
+    pix = np.random.randint(0, 256, size=(30, 40, 3)).astype(np.uint8)
+    cache = LRUCache()
+
+    z_tree = invert_cmap(pix, l, colors * 255, cache=cache)
+    z_lut = invert_cmap(pix, l, colors * 255, method='lut', cache=cache)
+    assert (z_tree == z_lut).all()
+    # the second pass is answered from the table stored with the tree
+    z_lut = invert_cmap(pix, l, colors * 255, method='lut', cache=cache)
+    assert (z_tree == z_lut).all()
+    assert cache.misses == 1
+
+    # float images that came from 8-bit images also work
+    z_lut = invert_cmap(pix / 255., l, colors, method='lut', cache=cache)
+    assert (z_tree == z_lut).all()
+
+
+def invert_cmap_lut_max_dist_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.random.randint(0, 256, size=(20, 3)).astype(np.uint8)
+    pix = np.random.randint(0, 256, size=(30, 40, 3)).astype(np.uint8)
+    cache = LRUCache()
+    for metric, max_dist in [('rgb', 40.), ('rgb', 60.), ('cie76', 20.),
+                             ('ciede2000', 12.)]:
+        z_tree = invert_cmap(pix, l, colors, metric=metric,
+                             max_dist=max_dist, cache=cache)
+        z_lut = invert_cmap(pix, l, colors, method='lut', metric=metric,
+                            max_dist=max_dist, cache=cache)
+        assert_equal(z_lut.mask, z_tree.mask)
+        assert_allclose(z_lut.filled(-1), z_tree.filled(-1))
+        # one table per colormap, whatever max_dist is
+        index = get_cmap_index(l, colors, metric=metric, cache=cache)
+        assert_equal(len(index.luts), 1)
+
+
+def invert_cmap_tiled_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.ones((20, 3)) * l[:, None]
+    pix = np.random.random((37, 11, 3))
+
+    z = invert_cmap(pix, l, colors)
+    for method in ('tree', 'unique'):
+        # 5 rows per block, including a ragged last one
+        z_tiled = invert_cmap(pix, l, colors, method=method,
+                              max_memory=5 * 11 * 8 * (3 + 4))
+        assert (z == z_tiled).all()
+
+
+def block_rows_test():
+    assert block_rows(100, 3, 0) == 1
+    assert block_rows(100, 3, 100 * 8 * 7 * 10) == 10
+    assert block_rows(100, 3, 100 * 50 * 10, pixel_bytes=50) == 10
+
+
+def pixel_bytes_test():
+    colors = np.random.random((20, 3))
+    rgb = CmapIndex(colors, metric='rgb')
+    assert rgb.pixel_bytes(3) == 8 * (3 + 4)
+    # re-ranking keeps (M, candidates) arrays, so the budget scales with
+    # the number of candidates
+    index = CmapIndex(colors, metric='ciede2000')
+    small = index.pixel_bytes(3)
+    index.candidates *= 2
+    assert index.pixel_bytes(3) - small == small - CmapIndex(
+        colors, metric='cie76').pixel_bytes(3)
+
+
+def invert_cmap_blocks_rerank_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.random.random((20, 3))
+    pix = np.random.random((37, 11, 3))
+    z = invert_cmap(pix, l, colors, metric='ciede2000')
+    z_tiled = invert_cmap(pix, l, colors, metric='ciede2000',
+                          max_memory=1000)
+    assert (z == z_tiled).all()
+
+
+def invert_cmap_workers_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.ones((20, 3)) * l[:, None]
+    pix = np.random.random((37, 11, 3))
+
+    z = invert_cmap(pix, l, colors)
+    for method in ('tree', 'unique'):
+        z_threaded = invert_cmap(pix, l, colors, method=method, workers=3)
+        assert (z == z_threaded).all()
+    z_threaded = invert_cmap(pix, l, colors, workers=-1, max_memory=1)
+    assert (z == z_threaded).all()
+
+    # threads share a lookup table that is created on first use
+    pix = np.random.randint(0, 256, size=(200, 200, 3)).astype(np.uint8)
+    colors = np.random.randint(0, 256, size=(20, 3))
+    z = invert_cmap(pix, l, colors, cache=None)
+    for _ in range(3):
+        z_threaded = invert_cmap(pix, l, colors, method='lut', workers=8,
+                                 cache=None)
+        assert (z == z_threaded).all()
+
+
+def invert_cmap_metric_test():
+    l = np.linspace(0, 1, 30)
+    colors = np.random.random((30, 3))
+    pix = np.random.random((10, 10, 3))
+    lab_pix = rgb_to_lab(pix.reshape((-1, 3)))
+    lab_colors = rgb_to_lab(colors)
+
+    metrics = [('cie76', deltaE_cie76), ('ciede94', deltaE_ciede94),
+               ('ciede2000', deltaE_ciede2000), ('cmc', deltaE_cmc)]
+    for metric, deltaE in metrics:
+        index = CmapIndex(colors, metric=metric)
+        index.candidates = len(colors)  # re-rank everything: exact answer
+        dE = deltaE(lab_colors[None, :, :], lab_pix[:, None, :])
+        oracle = np.argmin(dE, axis=1)
+        assert (index.tree_query(pix.reshape((-1, 3))) == oracle).all()
+
+        z = invert_cmap(pix, l, colors, metric=metric)
+        assert z.shape == (10, 10)
+
+        # grays have no hue difference, where round-off used to give NaN
+        gray = np.ones((30, 3)) * l[:, None]
+        z = invert_cmap(gray[None, :, :], l, gray, metric=metric)
+        assert_allclose(z[0], l)
+
+
+def invert_cmap_max_dist_test():
+    l = np.linspace(0, 1, 20)
+    colors = np.zeros((20, 3))
+    colors[:, 0] = l
+    pix = np.zeros((4, 5, 3))
+    pix[..., 0] = 0.5
+    pix[0, 0] = [0.5, 1, 1]  # far from every color on the colormap
+
+    for metric in ('rgb', 'cie76', 'ciede2000'):
+        for method in ('tree', 'unique'):
+            z = invert_cmap(pix, l, colors, method=method, metric=metric,
+                            max_dist=0.2 if metric == 'rgb' else 20)
+            assert isinstance(z, np.ma.MaskedArray)
+            assert z.mask[0, 0]
+            assert z.mask.sum() == 1
+            assert np.isnan(z.data[0, 0])
+
+    pix8 = np.asarray(pix * 255, dtype=np.uint8)
+    z = invert_cmap(pix8, l, colors * 255, method='lut', max_dist=50)
+    assert z.mask[0, 0]
+    assert z.mask.sum() == 1
+
+    # a color exactly max_dist away is kept
+    z = invert_cmap([[[3, 4, 0]]], [0.5], [[0, 0, 0]], max_dist=5.)
+    assert not z.mask[0, 0]
+    z = invert_cmap([[[3, 4, 0]]], [0.5], [[0, 0, 0]], max_dist=4.99)
+    assert z.mask[0, 0]
+
+
+def invert_cmap_interpolate_test():
+    # coarse, piecewise-linear colormap: 5 samples from black to red to white
+    l = np.linspace(0, 1, 5)
+    colors = np.array([[0, 0, 0], [.5, 0, 0], [1, 0, 0], [1, .5, .5],
+                       [1, 1, 1]])
+    z_true = np.random.random((6, 7))
+    pix = np.empty((6, 7, 3))
+    for c in range(3):
+        pix[..., c] = np.interp(z_true, l, colors[:, c])
+
+    z = invert_cmap(pix, l, colors, interpolate=True)
+    assert_allclose(z, z_true)
+    z = invert_cmap(pix, l, colors, interpolate=True, method='unique')
+    assert_allclose(z, z_true)
+    # without interpolation, the answer snaps to the 5 samples
+    z = invert_cmap(pix, l, colors)
+    assert set(np.unique(z)) <= set(l)
+
+    pix[0, 0] = [0, 1, 0]
+    z = invert_cmap(pix, l, colors, interpolate=True, max_dist=0.1)
+    assert z.mask[0, 0]
+    assert z.mask.sum() == 1
+
+    z_tiled = invert_cmap(pix, l, colors, interpolate=True, max_dist=0.1,
+                          max_memory=1000)
+    assert_allclose(z_tiled.filled(np.nan), z.filled(np.nan))
+
+
+def invert_cmap_interpolate_single_color_test():
+    # a single color has no segments; pixels off it are still masked
+    pix = np.array([[[0, 0, 0], [1, 1, 1]]], dtype=float)
+    z = invert_cmap(pix, [0.3], [[0, 0, 0]], interpolate=True, max_dist=0.1)
+    assert_allclose(z.data[0, 0], 0.3)
+    assert_equal(z.mask, [[False, True]])
+
+
+def color_mask_test():
+    rng = np.random.RandomState(0)
+    pix = rng.randint(0, 256, size=(20, 30, 3)).astype(np.uint8)
+    color = [200, 30, 60]
+    d = np.sqrt(np.sum((pix - np.array(color, dtype=float))**2, axis=-1))
+    yield assert_allclose, color_mask(pix, color, 120.), d <= 120.
+
+    # a single color is still compared with the requested metric
+    lab = rgb_to_lab(pix.reshape((-1, 3)))
+    ref = rgb_to_lab(np.array([color], dtype=np.uint8))
+    dE = deltaE_ciede2000(ref, lab).reshape(d.shape)
+    mask = color_mask(pix, color, 40., metric='ciede2000')
+    yield assert_allclose, mask, dE <= 40.
+
+
+def pixel_to_data_test():
+    shape = (4, 5)
+    x, y = pixel_to_data([0, 3], [0, 4], shape)
+    yield assert_allclose, x, [0, 4]
+    yield assert_allclose, y, [0, 3]
+    extent = (10., 20., 1., 2.)
+    x, y = pixel_to_data([0, 3], [0, 4], shape, extent=extent)
+    yield assert_allclose, x, [11., 19.]
+    yield assert_allclose, y, [1.875, 1.125]
+    x, y = pixel_to_data([0, 3], [0, 4], shape, extent=extent, origin='lower')
+    yield assert_allclose, y, [1.125, 1.875]
+
+
+def digitize_lines_test():
+    # a red diagonal 3 pixels thick on white, with a red speck
+    pix = np.ones((60, 80, 3))
+    for w in (-1, 0, 1):
+        pix[np.arange(10, 50), np.arange(20, 60) + w] = (1, 0, 0)
+    pix[5, 70] = (1, 0, 0)
+    offsets, x, y = digitize_lines(pix, (1, 0, 0), 0.1,
+                                   extent=(0., 80., 0., 60.))
+    ok_(offsets.tolist() == [0, 2])
+    # skeletonizing trims a little off the ends of the line
+    assert_allclose(sorted(x), [20.5, 59.5], atol=1.5)
+    assert_allclose(x + y, 70, atol=1.)
@@ -1,5 +1,10 @@
-from yoink.simplify import rdp_indexes
+from itertools import count, islice
+
+from yoink.simplify import (rdp_indexes, rdp_indexes_batch, point_line_dist2,
+                            vw_indexes, opening_window, img2line, img2paths,
+                            mask2paths)
 import numpy as np
+from numpy.testing import assert_allclose
 
 
 def test_rdp_indexes_bigeps():
@@ -27,3 +32,156 @@ def test_rdp_indexes_0eps():
 
     indexes = rdp_indexes(p, 0.)
     assert indexes == range(len(x))
+
+
+def test_rdp_indexes_batch():
+    rng = np.random.RandomState(0)
+    lengths = rng.randint(0, 60, size=40)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    points = np.cumsum(rng.normal(size=(offsets[-1], 2)), axis=0)
+
+    new_offsets, indexes = rdp_indexes_batch(points, offsets, 2.)
+    assert len(new_offsets) == len(offsets)
+    for k in range(len(lengths)):
+        line = points[offsets[k]:offsets[k+1]]
+        kept = indexes[new_offsets[k]:new_offsets[k+1]].tolist()
+        oracle = rdp_indexes(line, 2., dist2=point_line_dist2)
+        assert kept == oracle
+
+
+def test_rdp_indexes_dist2():
+    x = [0, 0.5, 3, 5, 7, 8, 9, 12]
+    y = [5, 2.5, 0, 2.5, 4, 3.5, 2, 5]
+    p = np.vstack([x, y]).T
+
+    def half_dist2(p, l1, l2):
+        return point_line_dist2(p, l1, l2) / 4
+
+    assert rdp_indexes(p, 0.9/4, dist2=half_dist2) == [0, 2, 4, 6, 7]
+    assert rdp_indexes(p, 0.9, dist2=half_dist2) == [0, 2, 7]
+
+
+def test_img2line():
+    img = np.zeros((4, 5), dtype=bool)
+    img[[0, 1, 1, 3], [2, 0, 4, 1]] = True
+    ii, jj = img2line(img)
+    assert ii.tolist() == [0, 1, 1, 3]
+    assert jj.tolist() == [2, 0, 4, 1]
+
+
+def _steps(offsets, ii, jj, k):
+    s = slice(offsets[k], offsets[k+1])
+    return np.maximum(abs(np.diff(ii[s])), abs(np.diff(jj[s])))
+
+
+def test_img2paths_staircase():
+    # a staircase drawn out of order; edge neighbors come before corners
+    ii = np.array([5, 4, 4, 3, 3, 2, 2, 1])
+    jj = np.array([0, 0, 1, 1, 2, 2, 3, 3])
+    img = np.zeros((7, 5), dtype=bool)
+    img[ii, jj] = True
+    offsets, pi, pj = img2paths(img)
+    assert offsets.tolist() == [0, 8]
+    # starts from the first end point in raster order
+    assert pi.tolist() == ii[::-1].tolist()
+    assert pj.tolist() == jj[::-1].tolist()
+
+
+def test_img2paths_loop_and_branch():
+    img = np.zeros((12, 12), dtype=bool)
+    img[2, 2:9] = img[8, 2:9] = img[2:9, 2] = img[2:9, 8] = True
+    offsets, ii, jj = img2paths(img)
+    assert offsets.tolist() == [0, 25]
+    assert (_steps(offsets, ii, jj, 0) == 1).all()
+    assert (ii[0], jj[0]) == (ii[-1], jj[-1])
+
+    # a tail off the loop is walked first, from its end point
+    img[9:11, 5] = True
+    offsets, ii, jj = img2paths(img)
+    assert img.sum() == len(set(zip(ii, jj)))
+    assert (ii[0], jj[0]) == (10, 5)
+    for k in range(len(offsets) - 1):
+        assert (_steps(offsets, ii, jj, k) == 1).all()
+
+
+def test_mask2paths():
+    mask = np.zeros((40, 40), dtype=bool)
+    mask[18:23, 3:37] = True
+    mask[2, 2] = True
+    offsets, ii, jj = mask2paths(mask)
+    assert offsets.tolist() == [0, 2]
+    assert (abs(ii - 20) <= 1).all()
+    assert sorted(jj)[0] <= 5 and sorted(jj)[1] >= 34
+
+
+def _vw_brute_force(points, n):
+    """O(n**2) Visvalingam-Whyatt, recomputing every area each step"""
+    kept = list(range(len(points)))
+    largest = 0.
+    areas = {}
+    while len(kept) > n:
+        for k in range(1, len(kept) - 1):
+            a, b, c = points[kept[k-1]], points[kept[k]], points[kept[k+1]]
+            u, v = b - a, c - a
+            area = 0.5 * abs(u[0] * v[1] - u[1] * v[0])
+            areas[kept[k]] = max(area, areas.get(kept[k], 0))
+        k = min(range(1, len(kept) - 1), key=lambda k: areas[kept[k]])
+        largest = max(largest, areas[kept[k]])
+        for j in (kept[k-1], kept[k+1]):
+            areas[j] = largest
+        kept.pop(k)
+    return kept
+
+
+def test_vw_indexes_n():
+    rng = np.random.RandomState(0)
+    points = np.cumsum(rng.normal(size=(60, 2)), axis=0)
+    for n in (2, 5, 17, 59, 60, 100):
+        indexes = vw_indexes(points, n=n)
+        assert len(indexes) == min(n, 60)
+        assert indexes[0] == 0 and indexes[-1] == 59
+        assert indexes == _vw_brute_force(points, n)
+
+
+def test_vw_indexes_area():
+    x = [0, 1, 2, 3, 4, 5, 6]
+    y = [0, 0, 0, 1, 0, 0, 0]
+    p = np.vstack([x, y]).T
+    # collinear points go by default, the bump stays
+    assert vw_indexes(p) == [0, 2, 3, 4, 6]
+    assert vw_indexes(p, area=0.9) == [0, 2, 3, 4, 6]
+    assert vw_indexes(p, area=2.) == [0, 3, 6]
+    assert vw_indexes(p, area=3.) == [0, 6]
+    assert vw_indexes(p, n=4, area=3.) == [0, 3, 4, 6]
+
+
+def test_opening_window():
+    x = [0, 1, 2, 3, 4, 5, 6, 7, 8]
+    y = [0, 0.1, 0, -0.1, 0, 2, 4, 6, 8]
+    kept = list(opening_window(zip(x, y), 0.25))
+    assert [i for i, p in kept] == [0, 4, 8]
+    assert_allclose([p for i, p in kept], [(0, 0), (4, 0), (8, 8)])
+
+    # the window closes early when it is full
+    kept = list(opening_window(zip(x, y), 0.25, max_window=2))
+    assert [i for i, p in kept] == [0, 2, 4, 6, 8]
+
+    assert list(opening_window([], 1.)) == []
+    assert [i for i, p in opening_window([(3, 4)], 1.)] == [0]
+
+
+def test_opening_window_stream():
+    # kept points come out while the input is still being read
+    def staircase():
+        for k in count():
+            yield (k, 0) if k % 20 < 10 else (k, 5)
+    kept = opening_window(staircase(), 1.)
+    assert [i for i, p in islice(kept, 5)] == [0, 9, 11, 19, 21]
+
+
+def test_opening_window_paths():
+    img = np.zeros((12, 12), dtype=bool)
+    img[2, 2:9] = img[2:9, 8] = True
+    offsets, ii, jj = img2paths(img)
+    kept = [tuple(p) for i, p in opening_window(zip(ii, jj), 0.5)]
+    assert kept == [(2, 2), (2, 8), (8, 8)] or kept == [(8, 8), (2, 8), (2, 2)]
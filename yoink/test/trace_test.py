@@ -1,10 +1,14 @@
-from numpy.testing import assert_almost_equal
+from numpy.testing import assert_almost_equal, assert_equal, assert_raises
 from nose.tools import ok_
 import numpy as np
+from scipy.ndimage import map_coordinates
 
-from yoink.trace import naive_trace
+from yoink.trace import (naive_trace, crossing_trace, bresenham_trace,
+                         bresenham_trace_batch)
 from yoink.trace import (equispaced_colormapping, naive_colormapping,
-                         bresenham_colormapping)
+                         bresenham_colormapping, polyline_colormapping,
+                         prune_colormapping, samples_for_length,
+                         get_rgb, get_rgb_band)
 
 X0, Y0 = 4.2, 1.2
 
@@ -119,3 +123,158 @@ def bresenham_colormapping_test1():
     COLORS = [0., 2.06, 3.18, 9.]
     colors = np.interp(points, l, r)
     assert_almost_equal(colors, COLORS, 2)
+
+
+def bresenham_trace_batch_test():
+    rng = np.random.RandomState(0)
+    x0, y0, x1, y1 = rng.randint(-50, 50, size=(4, 200))
+    # include degenerate, horizontal, vertical, and diagonal lines
+    x1[:4] = x0[:4] + [0, 7, 0, 7]
+    y1[:4] = y0[:4] + [0, 0, 7, -7]
+
+    offsets, x, y = bresenham_trace_batch(x0, y0, x1, y1)
+    assert len(offsets) == len(x0) + 1
+    for n in range(len(x0)):
+        path = bresenham_trace(x0[n], y0[n], x1[n], y1[n])
+        s = slice(offsets[n], offsets[n+1])
+        assert list(zip(x[s], y[s])) == path
+
+
+def crossing_trace_test():
+    oracles = [
+        ((X0, Y0, X0+1, Y0), [(4, 4.2, 1, 1.2), (5, 5.0, 1, 1.2),
+                              (5, 5.2, 1, 1.2)]),
+        ((X0, Y0, X0-1, Y0), [(4, 4.2, 1, 1.2), (4, 4.0, 1, 1.2),
+                              (3, 3.2, 1, 1.2)]),
+        ((X0, Y0, X0, Y0+1), [(4, 4.2, 1, 1.2), (4, 4.2, 2, 2.0),
+                              (4, 4.2, 2, 2.2)]),
+        ((X0, Y0, X0, Y0-1), [(4, 4.2, 1, 1.2), (4, 4.2, 1, 1.0),
+                              (4, 4.2, 0, 0.2)]),
+    ]
+    for line, oracle in oracles:
+        ix, x, iy, y = crossing_trace(*line)
+        oj, ox, oi, oy = zip(*oracle)
+        yield assert_equal, ix, oj
+        yield assert_equal, iy, oi
+        yield assert_almost_equal, x, ox
+        yield assert_almost_equal, y, oy
+
+
+def crossing_trace_matches_naive_test():
+    rng = np.random.RandomState(0)
+    x0, y0 = rng.uniform(20, 40, size=(2, 50))
+    # naive_trace needs lines that span a couple of pixels in x and y
+    x1, y1 = rng.choice([-1, 1], size=(2, 50)) * rng.uniform(2, 20, (2, 50))
+    x1 += x0
+    y1 += y0
+    for x0, y0, x1, y1 in zip(x0, y0, x1, y1):
+        ix, x, iy, y = crossing_trace(x0, y0, x1, y1)
+        oj, ox, oi, oy = zip(*naive_trace(x0, y0, x1, y1))
+        yield assert_equal, ix, oj
+        yield assert_equal, iy, oi
+        yield assert_almost_equal, x, ox
+        yield assert_almost_equal, y, oy
+
+
+def crossing_trace_one_pixel_test():
+    ix, x, iy, y = crossing_trace(8.4, 3.6, 8.9, 3.5)
+    assert_equal(ix, [8, 8])
+    assert_equal(iy, [3, 3])
+    assert_almost_equal(x, [8.4, 8.9])
+    assert_almost_equal(y, [3.6, 3.5])
+
+
+def get_rgb_test():
+    rng = np.random.RandomState(0)
+    im = rng.random_sample((20, 30, 3))
+    y = rng.uniform(2, 17, 25)
+    x = rng.uniform(2, 27, 25)
+    for order in (1, 3):
+        oracle = np.array([map_coordinates(im[:, :, c], [y, x], order=order)
+                           for c in range(3)]).T
+        points = get_rgb(im, y, x, order=order)
+        yield assert_almost_equal, points[1:-1], oracle[1:-1]
+        # the second call reuses the cached spline coefficients
+        points = get_rgb(im, y, x, order=order)
+        yield assert_almost_equal, points[1:-1], oracle[1:-1]
+
+
+def polyline_colormapping_test():
+    ni, nj, nc = 12, 12, 3
+    im = np.ones((ni, nj, nc)) * np.arange(nj, dtype=float)[None, :, None]
+    im += 10 * np.arange(ni, dtype=float)[:, None, None]
+
+    # a straight path matches equispaced_colormapping
+    l, c = polyline_colormapping([0.1, 9.9], [0.5, 0.5], im, N=20)
+    l_eq, c_eq = equispaced_colormapping(0.1, 0.5, 9.9, 0.5, im, N=20)
+    yield assert_almost_equal, l, l_eq
+    yield assert_almost_equal, c, c_eq
+
+    # an L-shaped path turns the corner half way along
+    l, c = polyline_colormapping([1, 9, 9], [1, 1, 9], im, N=17)
+    yield assert_almost_equal, c[:9, 0], 10 + np.arange(1, 10)
+    yield assert_almost_equal, c[8:, 0], 9 + 10 * np.arange(1, 10)
+
+    # the jump across a NaN vertex is not sampled
+    l, c = polyline_colormapping([1, 5, np.nan, 5, 9], [1, 1, np.nan, 9, 9],
+                                 im, N=9)
+    yield assert_almost_equal, c[:5, 0], 10 + np.arange(1, 6)
+    yield assert_almost_equal, c[5:, 0], 90 + np.arange(6, 10)
+
+    # paths without any segment to sample
+    nan = np.nan
+    yield assert_raises, ValueError, polyline_colormapping, [nan, nan], \
+        [1, 2], im
+    yield assert_raises, ValueError, polyline_colormapping, [1, nan, 5], \
+        [1, nan, 5], im
+
+
+def get_rgb_band_test():
+    rng = np.random.RandomState(0)
+    im = rng.random_sample((20, 30, 3))
+    y = rng.uniform(4, 15, 25)
+    x = rng.uniform(4, 25, 25)
+    ny, nx = np.zeros(25), np.ones(25)
+    for reduce, reducer in [('mean', np.mean), ('median', np.median)]:
+        band = [get_rgb(im, y, x + w)[1:-1] for w in (-2, -1, 0, 1, 2)]
+        oracle = reducer(band, axis=0)
+        points = get_rgb_band(im, y, x, ny, nx, width=5, reduce=reduce)
+        yield assert_almost_equal, points[1:-1], oracle
+
+
+def band_colormapping_test():
+    # noise that alternates across a horizontal colorbar averages out
+    ni, nj, nc = 9, 12, 3
+    im = np.ones((ni, nj, nc)) * np.arange(nj, dtype=float)[None, :, None]
+    im += np.where(np.arange(ni) % 2, 0.5, -0.5)[:, None, None]
+    l, c = equispaced_colormapping(1, 4, 10, 4, im, N=10, width=2)
+    assert_almost_equal(c[:, 0], np.arange(1, 11))
+    l, c = equispaced_colormapping(1, 4, 10, 4, im, N=10, width=3,
+                                   reduce='median')
+    assert_almost_equal(c[:, 0], np.arange(1, 11) + 0.5)
+
+
+def samples_for_length_test():
+    yield assert_equal, samples_for_length(0), 2
+    yield assert_equal, samples_for_length(9), 10
+    yield assert_equal, samples_for_length(9.2), 11
+    l, c = polyline_colormapping([0, 3, 3], [0, 0, 4.5], np.ones((9, 9, 3)),
+                                 N=None)
+    yield assert_equal, len(l), 9
+
+
+def prune_colormapping_test():
+    l = np.linspace(0, 1, 100)
+    rgb = np.zeros((100, 3))
+    rgb[60:] = 1
+    pl, prgb = prune_colormapping(l, rgb)
+    # a flat colorbar with one edge keeps the ends and both sides of the edge
+    assert_almost_equal(pl, l[[0, 59, 60, 99]])
+    assert_almost_equal(prgb, rgb[[0, 59, 60, 99]])
+
+    # a gradient keeps samples spaced about one jnd apart
+    rgb = np.repeat(np.linspace(0, 1, 1000)[:, None], 3, axis=1)
+    l = np.linspace(0, 1, 1000)
+    pl, prgb = prune_colormapping(l, rgb, jnd=2., metric='cie76')
+    ok_(50 < len(pl) < 110)
+    ok_(np.diff(pl).max() < 0.05)
@@ -0,0 +1,97 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+from nose.tools import ok_
+
+from yoink.widgets import RecoloredWidget
+from yoink.interp import invert_cmap
+
+
+def _widget(**kw):
+    rs = np.random.RandomState(0)
+    pixels = rs.rand(60, 80, 3)
+    l = np.linspace(0, 1, 10)
+    rgb = rs.rand(10, 3)
+    fig, ax = plt.subplots()
+    widget = RecoloredWidget(ax, pixels, **kw)
+    return widget, pixels, l, rgb
+
+
+def _assert_recolored(widget, pixels, l, rgb, invert_kw=None):
+    expected = invert_cmap(pixels, l, rgb, **(invert_kw or {}))
+    assert_allclose(np.ma.filled(widget.pixels, np.nan),
+                    np.ma.filled(expected, np.nan))
+    assert_equal(np.ma.getmaskarray(widget.pixels),
+                 np.ma.getmaskarray(expected))
+
+
+def crop_growth_test():
+    invert_kw = {'max_dist': 0.3}
+    widget, pixels, l, rgb = _widget(invert_kw=invert_kw)
+    widget.crop((10, 30, 5, 25))
+    widget.digitize(l, rgb)
+    ok_(widget._digitized[5:25, 10:30].all())
+    ok_(not widget._digitized.all())
+    # growing the crop recolors only the newly exposed pixels
+    widget.crop((0, 80, 0, 60))
+    ok_(widget._digitized.all())
+    _assert_recolored(widget, pixels, l, rgb, invert_kw)
+
+
+def background_digitize_test():
+    widget, pixels, l, rgb = _widget(background=True)
+    widget.digitize(l, rgb)
+    widget.wait()
+    ok_(widget.l is l)
+    _assert_recolored(widget, pixels, l, rgb)
+
+
+def background_supersede_test():
+    widget, pixels, l, rgb = _widget(background=True)
+    l2 = l ** 2
+    widget.digitize(l, rgb)
+    widget.digitize(l2, rgb)
+    widget.wait()
+    ok_(widget.l is l2)
+    _assert_recolored(widget, pixels, l2, rgb)
+
+
+def background_crop_test():
+    widget, pixels, l, rgb = _widget(background=True)
+    widget.digitize(l, rgb)
+    widget.wait()
+    thread = widget._thread
+    # nothing new to recolor when the crop shrinks
+    widget.crop((10, 30, 5, 25))
+    ok_(widget._job_l is None)
+    ok_(widget._thread is thread)
+
+
+def background_error_test():
+    # lookup tables need 8-bit pixels, so the job fails
+    widget, pixels, l, rgb = _widget(background=True,
+                                     invert_kw={'method': 'lut'})
+    widget.digitize(l, rgb)
+    try:
+        widget.wait()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('job error was not raised')
+    ok_(widget._job_l is None)
+
+
+def preview_stride_test():
+    widget, pixels, l, rgb = _widget()
+    widget.crop((0, 80, 0, 60))
+    # pretend recoloring is slow so that the preview must skip pixels
+    widget._preview_rate = 100.
+    widget.preview_budget = 1.
+    widget.preview(l, rgb)
+    z = widget.image.get_array()
+    stride = 7  # ceil(sqrt(60 * 80 / 100))
+    assert_equal(z.shape, (9, 12))
+    assert_allclose(np.ma.filled(z, np.nan),
+                    invert_cmap(pixels[::stride, ::stride], l, rgb))
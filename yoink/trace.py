@@ -1,9 +1,13 @@
 """Find the pixels between two endpoints"""
 from __future__ import division, print_function
-from math import floor
+from math import ceil, floor
+import weakref
 
 import numpy as np
-from scipy.ndimage.interpolation import map_coordinates
+from scipy.ndimage.interpolation import map_coordinates, spline_filter
+
+from .cache import LRUCache
+from .interp import CmapIndex, rgb_to_lab
 
 
 def naive_trace(x0, y0, x1, y1):
@@ -68,6 +72,54 @@ def naive_trace(x0, y0, x1, y1):
     assert False
 
 
+def crossing_trace(x0, y0, x1, y1):
+    """
+    For a line (x0, y0) to (x1, y1), find every point where the line crosses
+    a pixel boundary, computed all at once with array operations.
+
+    Returns the same points as naive_trace, as arrays rather than a list of
+    tuples.  Where the line passes exactly through a pixel corner, the x
+    crossing comes before the y crossing.
+
+    Parameters
+    ----------
+    x0, y0, x1, y1 : float
+        start and end of the line
+
+    Returns
+    -------
+    ix : ndarray of ints
+        pixel index of each point in x
+    x : ndarray
+        x coordinate of the start point, each crossing, and the end point
+    iy : ndarray of ints
+        pixel index of each point in y
+    y : ndarray
+        y coordinate of the start point, each crossing, and the end point
+
+    References
+    ----------
+    .. [1] John Amanatides & Andrew Woo, "A Fast Voxel Traversal Algorithm
+           for Ray Tracing", Eurographics '87, 3-10 (1987)
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+
+    # grid lines strictly between the endpoints, and where they are crossed
+    xs = np.arange(floor(min(x0, x1)) + 1, ceil(max(x0, x1)), dtype=float)
+    ys = np.arange(floor(min(y0, y1)) + 1, ceil(max(y0, y1)), dtype=float)
+    tx = (xs - x0) / dx if len(xs) else xs
+    ty = (ys - y0) / dy if len(ys) else ys
+
+    # stable sort, so x crossings come first at corners
+    order = np.argsort(np.concatenate((tx, ty)), kind='mergesort')
+    x = np.concatenate(([x0], np.concatenate((xs, x0 + ty * dx))[order], [x1]))
+    y = np.concatenate(([y0], np.concatenate((y0 + tx * dy, ys))[order], [y1]))
+    ix = np.floor(x).astype(int)
+    iy = np.floor(y).astype(int)
+    return ix, x, iy, y
+
+
 def bresenham_trace(x, y, x1, y1):
     """
     For a line (x, y) to (x1, y1) return the pixels that the line crosses.
@@ -95,8 +147,6 @@ def bresenham_trace(x, y, x1, y1):
         if e2 > -dy:
             err -= dy
             x += sx
-        if (x, y) == (x1, y1):
-            break
         if e2 < dx:
             err += dx
             y += sy
@@ -105,10 +155,69 @@ def bresenham_trace(x, y, x1, y1):
     return path
 
 
+def bresenham_trace_batch(x0, y0, x1, y1):
+    """
+    Vectorized bresenham_trace for many lines at once.
+
+    Pixel k of a line whose major axis is x is (x0 + sx*k, y0 + sy*m), where
+    m = (2*k*dy + dx - 1) // (2*dx), which is the same pixel that stepping
+    through Bresenham's algorithm gives.  Likewise for lines whose major
+    axis is y.
+
+    Parameters
+    ----------
+    x0, y0, x1, y1 : array_like
+        start and end points of each line.  Truncated to ints, like
+        bresenham_trace.
+
+    Returns
+    -------
+    offsets : ndarray, shape=(nlines+1,)
+        the pixels of line n are x[offsets[n]:offsets[n+1]], and likewise y
+    x : ndarray
+        x coordinates of the pixels of every line, one line after another
+    y : ndarray
+        y coordinates of the pixels of every line, one line after another
+    """
+    x0, y0, x1, y1 = [np.atleast_1d(np.asarray(a)).astype(int)
+                      for a in (x0, y0, x1, y1)]
+    dx = np.abs(x1 - x0)
+    dy = np.abs(y1 - y0)
+    sx = np.where(x0 < x1, 1, -1)
+    sy = np.where(y0 < y1, 1, -1)
+
+    # per-line constants, so that the per-pixel work is a few gathers and
+    # multiply-adds
+    xmajor = dx >= dy
+    major = np.where(xmajor, dx, dy)
+    minor = np.where(xmajor, dy, dx)
+    num = np.maximum(major - 1, 0)
+    den = np.maximum(2*major, 1)
+    n = major + 1
+
+    offsets = np.zeros(len(n) + 1, dtype=int)
+    np.cumsum(n, out=offsets[1:])
+    line = np.repeat(np.arange(len(n)), n)
+    k = np.arange(offsets[-1])
+    k -= offsets[line]
+
+    m = k * (2*minor)[line]
+    m += num[line]
+    m //= den[line]
+
+    x = x0[line]
+    x += (sx * xmajor)[line] * k
+    x += (sx * ~xmajor)[line] * m
+    y = y0[line]
+    y += (sy * ~xmajor)[line] * k
+    y += (sy * xmajor)[line] * m
+    return offsets, x, y
+
+
 def naive_colormapping(x0, y0, x1, y1, im, order=1):
     """
-    Get lineout from x0/y0 to x1/y1 with points takein from naive_trace ray
-    tracing algorithm.
+    Get lineout from x0/y0 to x1/y1 with points taken at every pixel
+    boundary crossing (see crossing_trace).
 
     Returns
     -------
@@ -118,9 +227,7 @@ def naive_colormapping(x0, y0, x1, y1, im, order=1):
     rgb : ndarray, shape=(N,3)
         sequence of colors at each point in l
     """
-    stuff = naive_trace(x0, y0, x1, y1)
-    jj, x, jj, y = zip(*stuff)
-    x, y = np.array(x), np.array(y)
+    jj, x, ii, y = crossing_trace(x0, y0, x1, y1)
     dx = x[-1] - x[0]
     dy = y[-1] - y[0]
     if dx > dy:
@@ -130,10 +237,15 @@ def naive_colormapping(x0, y0, x1, y1, im, order=1):
     return l, get_rgb(im, y, x, order=order)
 
 
-def equispaced_colormapping(x0, y0, x1, y1, im, N=256, order=1):
+def equispaced_colormapping(x0, y0, x1, y1, im, N=256, order=1, width=1,
+                            reduce='mean', jnd=None):
     """
     Get lineout from x0/y0 to x1/y1 with equally spaced points.
 
+    N=None takes one sample per pixel of line length.  `width` and `reduce`
+    average over a band across the line, and `jnd` prunes redundant
+    samples, see polyline_colormapping.
+
     Returns
     -------
 
@@ -142,12 +254,159 @@ def equispaced_colormapping(x0, y0, x1, y1, im, N=256, order=1):
     rgb : ndarray, shape=(N,3)
         sequence of colors at each point in l
     """
+    if width > 1 or jnd is not None:
+        return polyline_colormapping([x0, x1], [y0, y1], im, N=N,
+                                     order=order, width=width, reduce=reduce,
+                                     jnd=jnd)
+    if N is None:
+        N = samples_for_length(np.hypot(x1 - x0, y1 - y0))
     y2 = np.linspace(y0, y1, N)
     x2 = np.linspace(x0, x1, N)
     l = np.linspace(0, 1, N)
     return l, get_rgb(im, y2, x2, order=order)
 
 
+def polyline_colormapping(x, y, im, N=256, order=1, width=1, reduce='mean',
+                          jnd=None, metric='ciede2000'):
+    """
+    Get lineout along a path of connected segments with points equally
+    spaced in arc length.
+
+    Useful for curved, circular, or split colorbars.  A NaN vertex breaks
+    the path: the segments on either side of it are sampled, the jump
+    across it is not.  All segments are sampled in a single get_rgb call.
+
+    Parameters
+    ----------
+    x, y : array_like, shape=(M,)
+        vertexes of the path, in pixel coordinates
+    im : ndarray, shape=(ni, nj, nc)
+        image to sample
+    N : int | None, optional
+        number of samples.  None takes one sample per pixel of arc length,
+        see samples_for_length.
+    order : int, optional
+        order of the spline interpolation
+    width : int, optional
+        number of pixels across the path to combine into each sample.  A
+        wider band suppresses noise like JPEG ringing.  See get_rgb_band.
+    reduce : {'mean', 'median'}, optional
+        how to combine the pixels across the band
+    jnd : float | None, optional
+        if given, merge runs of samples that differ by less than this
+        color difference, see prune_colormapping
+    metric : str, optional
+        color difference used with `jnd`
+
+    Returns
+    -------
+
+    l : ndarray, shape=(N,)
+        normalized arc length of colors
+    rgb : ndarray, shape=(N,3)
+        sequence of colors at each point in l
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    piece = np.cumsum(~valid)[valid]
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        raise ValueError('the path has no vertexes that are not NaN')
+
+    # segments that join vertexes of the same piece and have some length
+    dx = np.diff(x)
+    dy = np.diff(y)
+    length = np.hypot(dx, dy)
+    length[piece[1:] != piece[:-1]] = 0
+    seg = np.flatnonzero(length > 0)
+
+    if N is None:
+        N = samples_for_length(length.sum())
+    l = np.linspace(0, 1, N)
+    if len(seg) == 0 and piece[0] != piece[-1]:
+        raise ValueError('the path has no segments: every vertex is '
+                         'separated from the others by NaN')
+    if len(seg) == 0:
+        xs, ys = np.repeat(x[:1], N), np.repeat(y[:1], N)
+        ux, uy = np.ones(N), np.zeros(N)
+    else:
+        length = length[seg]
+        end = np.cumsum(length)
+        s = l * end[-1]
+        j = np.minimum(np.searchsorted(end, s), len(seg) - 1)
+        t = (s - (end[j] - length[j])) / length[j]
+        ux = (dx[seg] / length)[j]
+        uy = (dy[seg] / length)[j]
+        xs = x[seg][j] + t * length[j] * ux
+        ys = y[seg][j] + t * length[j] * uy
+
+    if width > 1:
+        # the band runs along the normal (-uy, ux) of each sample's segment
+        rgb = get_rgb_band(im, ys, xs, ux, -uy, width=width, reduce=reduce,
+                           order=order)
+    else:
+        rgb = get_rgb(im, ys, xs, order=order)
+    if jnd is not None:
+        l, rgb = prune_colormapping(l, rgb, jnd=jnd, metric=metric)
+    return l, rgb
+
+
+def samples_for_length(length):
+    """
+    Number of samples that puts one sample per pixel along a line of
+    `length` pixels, including both ends.  At least 2.
+    """
+    return max(int(ceil(length)) + 1, 2)
+
+
+def prune_colormapping(l, rgb, jnd=2.3, metric='ciede2000'):
+    """
+    Drop samples of a lineout that are indistinguishable from their
+    neighbors, so that flat stretches of a colorbar collapse to a few
+    samples while gradients keep their resolution.
+
+    Walking along the lineout, the color differences between consecutive
+    samples are accumulated.  Each time the total passes another multiple
+    of `jnd`, the samples on both sides of that step are kept, so a sharp
+    edge keeps the last color before it and the first color after it.
+    The first and last samples are always kept.
+
+    Parameters
+    ----------
+    l : ndarray, shape=(N,)
+        normalized location of colors
+    rgb : ndarray, shape=(N, nc)
+        uint8 colors, or float colors on [0, 1]
+    jnd : float, optional
+        just noticeable difference, see yoink.delta_e
+    metric : {'cie76', 'ciede94', 'ciede2000', 'cmc'}, optional
+        color difference to use
+
+    Returns
+    -------
+    l : ndarray, shape=(M,)
+        location of the kept colors
+    rgb : ndarray, shape=(M, nc)
+        kept colors
+    """
+    deltaE = CmapIndex.METRICS.get(metric)
+    if deltaE is None:
+        raise ValueError('unknown metric %r' % (metric,))
+    if len(l) < 3:
+        return l, rgb
+    lab = rgb_to_lab(rgb)
+    travel = np.zeros(len(l))
+    np.cumsum(deltaE(lab[:-1], lab[1:]), out=travel[1:])
+    travel //= jnd
+    crossed = travel[1:] != travel[:-1]
+    keep = np.zeros(len(l), dtype=bool)
+    keep[:-1] |= crossed
+    keep[1:] |= crossed
+    keep[[0, -1]] = True
+    return l[keep], rgb[keep]
+
+
 def bresenham_colormapping(x0, y0, x1, y1, im):
     """
     Get lineout from x0/y0 to x1/y1 with points taken using Bresenham's ray
@@ -166,8 +425,7 @@ def bresenham_colormapping(x0, y0, x1, y1, im):
         sequence of colors at each point in l
 
     """
-    x_y = bresenham_trace(x0, y0, x1, y1)
-    jj, ii = zip(*x_y)
+    offsets, jj, ii = bresenham_trace_batch(x0, y0, x1, y1)
     rgb = im[ii, jj]
 
     centers = np.vstack((ii, jj)).T
@@ -178,12 +436,110 @@ def bresenham_colormapping(x0, y0, x1, y1, im):
     return l, rgb
 
 
+#: spline coefficients of recently sampled images, see get_rgb
+SPLINE_CACHE = LRUCache(maxsize=2)
+
+
 def get_rgb(im, y, x, order=1):
+    """
+    Sample all color channels of an image at the points (y, x).
+
+    All channels are interpolated in a single map_coordinates call.  For
+    order > 1 the spline coefficients of the image are computed once and
+    kept in SPLINE_CACHE, so repeatedly sampling the same image only pays
+    for the interpolation.  Images are assumed not to change in place.
+
+    Parameters
+    ----------
+    im : array_like, shape=(ni, nj, nc)
+        image to sample
+    y, x : array_like, shape=(N,)
+        pixel coordinates of the samples
+    order : int, optional
+        order of the spline interpolation
+
+    Returns
+    -------
+    points : ndarray, shape=(N, nc)
+        color of each sample, in the dtype of `im`
+    """
     im = np.asarray(im)
-    ni, nj, nc = im.shape
-    points = np.zeros((len(x), nc), dtype=im.dtype)
-    for c in range(nc):
-        points[:, c] = map_coordinates(im[:, :, c], [y, x], order=order)
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    points = _sample(im, y, x, order, im.dtype)
     points[0, :] = im[int(y[0]), int(x[0])]
     points[-1, :] = im[int(y[-1]), int(x[-1])]
     return points
+
+
+def get_rgb_band(im, y, x, ny, nx, width=3, reduce='mean', order=1):
+    """
+    Sample all color channels of an image over a band of pixels across
+    each point (y, x), and combine each band into a single color.
+
+    The band for a point is `width` samples, one pixel apart, centered on
+    the point and running along the unit vector (ny, nx).  All N * width
+    samples are interpolated in a single map_coordinates call.
+
+    Parameters
+    ----------
+    im : array_like, shape=(ni, nj, nc)
+        image to sample
+    y, x : array_like, shape=(N,)
+        pixel coordinates of the band centers
+    ny, nx : array_like, shape=(N,)
+        direction of the band at each point, typically the normal of the
+        line being sampled
+    width : int, optional
+        number of samples in each band
+    reduce : {'mean', 'median'}, optional
+        how to combine the samples in each band
+    order : int, optional
+        order of the spline interpolation
+
+    Returns
+    -------
+    points : ndarray, shape=(N, nc)
+        combined color of each band, in the dtype of `im`
+    """
+    try:
+        reducer = {'mean': np.mean, 'median': np.median}[reduce]
+    except KeyError:
+        raise ValueError('unknown reduce %r' % (reduce,))
+    im = np.asarray(im)
+    nc = im.shape[2]
+    y, x, ny, nx = [np.asarray(a, dtype=float).reshape(-1, 1)
+                    for a in (y, x, ny, nx)]
+    w = np.arange(width) - (width - 1) / 2
+    yy = (y + w * ny).ravel()
+    xx = (x + w * nx).ravel()
+
+    points = _sample(im, yy, xx, order, float).reshape((-1, width, nc))
+    points = reducer(points, axis=1)
+    if issubclass(im.dtype.type, np.integer):
+        np.rint(points, out=points)
+    return points.astype(im.dtype)
+
+
+def _sample(im, y, x, order, dtype):
+    """Interpolate every channel of `im` at each point (y, x)"""
+    nc = im.shape[2]
+    # sample every channel at each point; interpolating at integer channel
+    # coordinates reproduces each channel exactly
+    coords = [np.repeat(y, nc),
+              np.repeat(x, nc),
+              np.tile(np.arange(nc), len(x))]
+    coeffs = _spline_coefficients(im, order) if order > 1 else im
+    points = map_coordinates(coeffs, coords, order=order, prefilter=False,
+                             mode='mirror', output=dtype)
+    return points.reshape((len(x), nc))
+
+
+def _spline_coefficients(im, order):
+    """spline_filter(im, order), memoized by image identity in SPLINE_CACHE"""
+    key = (id(im), order)
+    ref, coeffs = SPLINE_CACHE.get(key, lambda: (None, None))
+    if ref is None or ref() is not im:
+        coeffs = spline_filter(im, order=order)
+        SPLINE_CACHE.set(key, (weakref.ref(im), coeffs))
+    return coeffs
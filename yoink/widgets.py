@@ -1,6 +1,8 @@
 """Backend independent widgets."""
 from __future__ import division, print_function
 from functools import wraps, partial
+import threading
+import time
 
 import numpy as np
 from matplotlib.patches import Circle, Rectangle
@@ -10,7 +12,7 @@ from matplotlib.colorbar import colorbar_factory
 from matplotlib.ticker import ScalarFormatter
 
 from .textbox import TextBoxFloat
-from .trace import equispaced_colormapping
+from .trace import polyline_colormapping
 from .interp import invert_cmap
 
 from .has_actions import Actionable
@@ -56,7 +58,7 @@ class ShadowLine(AxesWidget):
 
 class DragableColorLine(Widget, Actionable):
     """
-    Fake colormap-like image taken from the end points of a DeformableLine
+    Fake colormap-like image taken along the vertexes of a DeformableLine
 
     Parameters
     ----------
@@ -70,6 +72,13 @@ class DragableColorLine(Widget, Actionable):
         keyword args to pass to Line2D
     circle_kw : dict, optional
         keyword args to pass to Circle
+    max_points : int | None, optional, default=2
+        Maximum number of vertexes of the line.  With more than two (or
+        None), left clicks add vertexes and middle clicks remove them, so
+        curved or split colorbars can be traced.
+    sample_kw : dict, optional
+        keyword args to pass to polyline_colormapping, e.g. `width` to
+        average over a band across the line
 
     Attributes
     ----------
@@ -90,7 +99,7 @@ class DragableColorLine(Widget, Actionable):
     ]
 
     def __init__(self, select_ax, cbar_ax, pixels,
-                 line_kw=None, circle_kw=None):
+                 line_kw=None, circle_kw=None, max_points=2, sample_kw=None):
         Widget.__init__(self)
         Actionable.__init__(self)
         self.select_ax = select_ax
@@ -108,11 +117,14 @@ class DragableColorLine(Widget, Actionable):
         ckw = dict(alpha=0.5, radius=10)
         if circle_kw is not None:
             ckw.update(circle_kw)
+        extendable = max_points is None or max_points > 2
         self.line = DeformableLine(select_ax,
-                                   grows=False, shrinks=False, max_points=2,
+                                   grows=extendable, shrinks=extendable,
+                                   max_points=max_points,
                                    line_kw=lkw,
                                    circle_kw=ckw)
         self.pixels = pixels.copy()
+        self.sample_kw = sample_kw if sample_kw is not None else {}
 
         xl, xr = select_ax.get_xlim()
         dx = xr - xl
@@ -144,11 +156,11 @@ class DragableColorLine(Widget, Actionable):
 
     def update(self):
         """update the properties of the line, redraw, and trigger observers"""
-        if len(self.line.circles) != 2:
+        if len(self.line.circles) < 2:
             return
-        x0, y0 = self.line.circles[0].center
-        x1, y1 = self.line.circles[1].center
-        self.l, self.rgb = equispaced_colormapping(x0, y0, x1, y1, self.pixels)
+        x, y = self.line.vertexes.T
+        self.l, self.rgb = polyline_colormapping(x, y, self.pixels,
+                                                 **self.sample_kw)
         cmap = make_cmap(self.l, self.rgb)
         self._im.set_cmap(cmap)
         if self.drawon:
@@ -297,6 +309,8 @@ class DeformableLine(AxesWidget, Actionable):
         if self.drawon:
             self.canvas.draw()
         self.changed()
+        # not part of a drag, so the edit is already complete
+        self.released()
 
     def set_visible(self, isvisible):
         self.visible = isvisible
@@ -530,31 +544,67 @@ class RecoloredWidget(AxesWidget, Actionable):
         Axes to draw the widget
     pixels : 3d array
         Source pixels to recolor
+    invert_kw : dict, optional
+        keyword args to pass to invert_cmap (e.g. method, workers).  Pass
+        max_dist to mask pixels whose color is far from the colorbar.
+    background : bool, optional
+        recolor in a worker thread so the GUI does not block.  A newer
+        digitize supersedes a job that is still running.  Results are
+        swapped into the image by a canvas timer on the GUI thread.
 
     Attributes
     ----------
     ax : axes
         Axes to draw the widget
-    pixels : 3d array
-        Source pixels to recolor
+    pixels : 2d MaskedArray
+        Recolored pixels.  Masked where the source color is off the colorbar.
+        Only pixels inside a crop window have been recolored since the last
+        digitize.
     image : matplotlib.Image
+    invert_kw : dict
+        keyword args to pass to invert_cmap
+    window : tuple
+        (y0, y1, x0, x1) the cropped region of pixels being displayed
+    background : bool
+        recolor in a worker thread
+    preview_budget : float
+        seconds that a preview may spend recoloring
     """
     ACTIONS = [
         ('on_changed', 'changed', 'disconnect'),
     ]
 
-    # TODO what to do for colors "far" from scale
-    def __init__(self, ax, pixels):
+    #: approximate number of pixels recolored between checks for a newer job
+    JOB_CHUNK = 1 << 16
+
+    def __init__(self, ax, pixels, invert_kw=None, background=False):
         AxesWidget.__init__(self, ax)
         Actionable.__init__(self)
+        self.invert_kw = invert_kw if invert_kw is not None else {}
+        self.background = background
         self._pixels = pixels
-        self.pixels = pixels[:, :, 0].copy()
+        self.pixels = np.ma.masked_array(pixels[:, :, 0], dtype=float,
+                                         mask=False, copy=True)
         self.image = self.ax.imshow(self.pixels,
                                     aspect='auto',
                                     interpolation='none',
                                     vmin=0,
                                     vmax=1)
         self.l = None
+        self.window = (0, pixels.shape[0], 0, pixels.shape[1])
+        # which pixels have been recolored with the current self.l
+        self._digitized = np.zeros(pixels.shape[:2], dtype=bool)
+
+        # background jobs.  Only the newest generation may touch the image.
+        self._generation = 0
+        self._job_l = None
+        self._thread = None
+        self._finished = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+        self.preview_budget = 0.05
+        self._preview_rate = None  # recently measured pixels per second
 
         self.observers = {}
         self.cid = 0
@@ -585,29 +635,191 @@ class RecoloredWidget(AxesWidget, Actionable):
             x0, x1 = x1, x0
         if y1 < y0:
             y0, y1 = y1, y0
-        pix = self.pixels[y0:y1, x0:x1]
-
-        self.image.set_data(pix)
+        ni, nj = self.pixels.shape
+        y0, y1 = np.clip([y0, y1], 0, ni)
+        x0, x1 = np.clip([x0, x1], 0, nj)
+        self.window = y0, y1, x0, x1
+        # only the newly exposed pixels need to be recolored
+        if not self.background:
+            self._digitize_window()
+        elif (self._job_l is None and self.l is not None and
+              not self._digitized[y0:y1, x0:x1].all()):
+            # a running job picks up the new window when it finishes
+            self._submit(self.l, self.rgb)
+
+        self.image.set_data(self.pixels[y0:y1, x0:x1])
         if self.drawon:
             self.canvas.draw()
         self.changed()
 
     def digitize(self, l, rgb):
         """
-        Using the new scale "l" and colorsequence "rgb" translate all pixels
-        to the new scale, create a cbar with l & rgb, and redraw the image.
+        Using the new scale "l" and colorsequence "rgb" translate the pixels
+        in the crop window to the new scale, create a cbar with l & rgb, and
+        redraw the image.
         """
-        if l is self.l:
+        if l is self.l and self._job_l is None or l is self._job_l:
             return
+        if self.background:
+            self._submit(l, rgb)
+            return
+        self._set_scale(l, rgb)
+        self._digitize_window()
+
+        y0, y1, x0, x1 = self.window
+        self.image.set_data(self.pixels[y0:y1, x0:x1])
+        if self.drawon:
+            self.canvas.draw()
+        self.changed()
+
+    def preview(self, l, rgb):
+        """
+        Quickly show roughly what digitize(l, rgb) will look like.
+
+        Recolors every n-th row and column of the crop window, with n chosen
+        from recent timings so that this takes about `preview_budget`
+        seconds.  Use it while the colorbar is being dragged, and call
+        digitize for the full resolution result.
+        """
+        if self._job_l is not None:
+            # whatever is running is stale now
+            self._generation += 1
+            self._job_l = None
+
+        y0, y1, x0, x1 = self.window
+        npix = (y1 - y0) * (x1 - x0)
+        if self._preview_rate is None:
+            target = 1 << 14
+        else:
+            target = self._preview_rate * self.preview_budget
+        stride = max(1, int(np.ceil(np.sqrt(npix / max(target, 1)))))
+
+        t0 = time.time()
+        sub = self._pixels[y0:y1:stride, x0:x1:stride]
+        z = invert_cmap(sub, l, rgb, **self.invert_kw)
+        dt = time.time() - t0
+        if dt > 0:
+            rate = sub.shape[0] * sub.shape[1] / dt
+            if self._preview_rate is not None:
+                rate = 0.5 * (rate + self._preview_rate)
+            self._preview_rate = rate
+
+        self.image.set_data(z)
+        self.image.set_cmap(make_cmap(l, rgb))
+        if self.drawon:
+            self.canvas.draw()
+
+    def _set_scale(self, l, rgb):
+        """Switch to a new scale; all pixels need to be recolored"""
         self.l = l
         self.rgb = rgb
-        self.pixels[:, :] = invert_cmap(self._pixels, l, rgb)
+        self._digitized[:, :] = False
         self.cmap = make_cmap(l, rgb)
         self.image.set_cmap(self.cmap)
+
+    def _submit(self, l, rgb):
+        """Start recoloring the crop window with scale l in a worker thread,
+        superseding any running job"""
+        self._generation += 1
+        self._job_l = l
+        y0, y1, x0, x1 = window = self.window
+        if l is self.l:
+            todo = ~self._digitized[y0:y1, x0:x1]
+        else:
+            todo = np.ones((y1 - y0, x1 - x0), dtype=bool)
+        args = (self._generation, l, rgb, window, todo)
+        self._thread = threading.Thread(target=self._run_job, args=args)
+        self._thread.daemon = True
+        self._thread.start()
+
+        if self._timer is None:
+            self._timer = self.canvas.new_timer(interval=50)
+            self._timer.add_callback(self.apply_finished)
+        self._timer.start()
+
+    def _run_job(self, generation, l, rgb, window, todo):
+        """Worker thread: recolor the `todo` pixels of `window`, giving up as
+        soon as a newer job has been submitted"""
+        y0, y1, x0, x1 = window
+        src = self._pixels[y0:y1, x0:x1]
+        z = np.empty(todo.shape)
+        mask = np.zeros(todo.shape, dtype=bool)
+        rows = max(1, self.JOB_CHUNK // max(x1 - x0, 1))
+        error = None
+        try:
+            for i0 in range(0, y1 - y0, rows):
+                if generation != self._generation:
+                    return
+                t = todo[i0:i0 + rows]
+                zt = invert_cmap(src[i0:i0 + rows][t][:, None, :], l, rgb,
+                                 **self.invert_kw)
+                z[i0:i0 + rows][t] = np.ma.filled(zt, np.nan)[:, 0]
+                mask[i0:i0 + rows][t] = np.ma.getmaskarray(zt)[:, 0]
+        except Exception as e:
+            # hand it to the GUI thread, which is waiting for this job
+            error = e
+        with self._lock:
+            # a superseded job must not clobber the newer job's result
+            if generation == self._generation:
+                self._finished = (generation, l, rgb, window, todo, z, mask,
+                                  error)
+
+    def apply_finished(self):
+        """
+        Swap the result of a finished background job into the image.  Called
+        periodically from the GUI thread while a job is running.  Re-raises
+        an exception raised by invert_cmap in the job.
+        """
+        with self._lock:
+            job, self._finished = self._finished, None
+        if job is None:
+            return
+        generation, l, rgb, window, todo, z, mask, error = job
+        if generation != self._generation:
+            return
+        self._job_l = None
+        if self._timer is not None:
+            self._timer.stop()
+        if error is not None:
+            raise error
+
+        if l is not self.l:
+            self._set_scale(l, rgb)
+        y0, y1, x0, x1 = window
+        self.pixels.data[y0:y1, x0:x1][todo] = z[todo]
+        self.pixels.mask[y0:y1, x0:x1][todo] = mask[todo]
+        self._digitized[y0:y1, x0:x1][todo] = True
+
+        y0, y1, x0, x1 = self.window
+        if not self._digitized[y0:y1, x0:x1].all():
+            # the crop changed while the job was running
+            self._submit(self.l, self.rgb)
+        self.image.set_data(self.pixels[y0:y1, x0:x1])
         if self.drawon:
             self.canvas.draw()
         self.changed()
 
+    def wait(self):
+        """Block until background recoloring is done and apply the result"""
+        while self._job_l is not None:
+            self._thread.join()
+            self.apply_finished()
+
+    def _digitize_window(self):
+        """Recolor the pixels in the crop window that have not been recolored
+        with the current scale"""
+        if self.l is None:
+            return
+        y0, y1, x0, x1 = self.window
+        todo = ~self._digitized[y0:y1, x0:x1]
+        if not todo.any():
+            return
+        src = self._pixels[y0:y1, x0:x1][todo]
+        z = invert_cmap(src[:, None, :], self.l, self.rgb, **self.invert_kw)
+        self.pixels.data[y0:y1, x0:x1][todo] = np.ma.filled(z, np.nan)[:, 0]
+        self.pixels.mask[y0:y1, x0:x1][todo] = np.ma.getmaskarray(z)[:, 0]
+        self._digitized[y0:y1, x0:x1][todo] = True
+
 
 def make_cmap(l, rgb):
     """Make a colormap from the sequence of distances & colors"""